@@ -0,0 +1,101 @@
+# archives.py
+# Export ZIP des résultats :
+# - méthode choisie par entrée : STORED pour les médias déjà compressés (MP4, MP3, JPEG...),
+#   DEFLATE pour le reste (WAV, texte, JSON)
+# - copie des fichiers par blocs, sans les charger en mémoire
+# - réutilisation de l’archive existante si l’ensemble des membres est inchangé
+#   (empreinte rangée dans le commentaire du ZIP)
+
+import os
+import json
+import shutil
+import hashlib
+import zipfile
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+# Extensions dont le contenu est déjà compressé : les dégonfler ne fait que consommer du CPU
+EXTENSIONS_STOCKEES = {".mp4", ".m4a", ".mov", ".mkv", ".webm", ".mp3", ".aac", ".ogg", ".opus",
+                       ".jpg", ".jpeg", ".png", ".webp", ".zip", ".gz", ".xz"}
+# Taille des blocs copiés dans l’archive
+TAILLE_BLOC = 1024 * 1024
+PREFIXE_EMPREINTE = b"empreinte:"
+
+# ---------------- Membres ----------------
+
+def methode_compression(chemin: Path) -> int:
+    """
+    Renvoie ZIP_STORED pour un média déjà compressé, ZIP_DEFLATED sinon.
+    """
+    return zipfile.ZIP_STORED if Path(chemin).suffix.lower() in EXTENSIONS_STOCKEES else zipfile.ZIP_DEFLATED
+
+def membres(fichiers: Iterable, racine: Optional[Path] = None) -> List[Tuple[Path, str]]:
+    """
+    Renvoie (chemin, nom dans l’archive) pour chaque fichier existant, sans doublon.
+    Les fichiers situés sous racine gardent leur sous-dossier (ex. img1_<base>/i_3s_1fps.jpg).
+    """
+    vus, res = set(), []
+    for f in fichiers:
+        f = Path(f)
+        if not f.is_file():
+            continue
+        nom = f.name
+        if racine is not None:
+            try:
+                nom = f.resolve().relative_to(Path(racine).resolve()).as_posix()
+            except ValueError:
+                pass
+        if nom not in vus:
+            vus.add(nom)
+            res.append((f, nom))
+    return res
+
+def empreinte(liste: List[Tuple[Path, str]]) -> str:
+    """
+    Empreinte de l’ensemble des membres : nom, taille et date de modification de chacun.
+    """
+    h = hashlib.sha1()
+    for f, nom in sorted(liste, key=lambda m: m[1]):
+        s = f.stat()
+        h.update(json.dumps([nom, s.st_size, s.st_mtime_ns]).encode("utf-8"))
+    return h.hexdigest()
+
+def _empreinte_archive(chemin_zip: Path) -> Optional[str]:
+    try:
+        with zipfile.ZipFile(str(chemin_zip)) as zf:
+            commentaire = zf.comment
+    except (OSError, zipfile.BadZipFile):
+        return None
+    if commentaire.startswith(PREFIXE_EMPREINTE):
+        return commentaire[len(PREFIXE_EMPREINTE):].decode("ascii", "replace")
+    return None
+
+# ---------------- Construction ----------------
+
+def construire_zip(fichiers: Iterable, chemin_zip: Path, racine: Optional[Path] = None) -> Tuple[Path, bool]:
+    """
+    Écrit l’archive chemin_zip (membres copiés par blocs, méthode choisie par entrée) et
+    renvoie (chemin, reutilisee). Si une archive existante a la même empreinte de membres,
+    elle est renvoyée telle quelle. L’écriture passe par un fichier .part renommé à la fin,
+    de sorte qu’une archive interrompue ne soit jamais réutilisée.
+    """
+    chemin_zip = Path(chemin_zip)
+    liste = membres(fichiers, racine)
+    cle = empreinte(liste)
+    if chemin_zip.exists() and _empreinte_archive(chemin_zip) == cle:
+        return chemin_zip, True
+
+    partiel = chemin_zip.with_name(chemin_zip.name + ".part")
+    try:
+        with zipfile.ZipFile(str(partiel), "w") as zf:
+            for f, nom in liste:
+                info = zipfile.ZipInfo.from_file(str(f), arcname=nom)
+                info.compress_type = methode_compression(f)
+                with open(f, "rb") as src, zf.open(info, "w", force_zip64=True) as dst:
+                    shutil.copyfileobj(src, dst, TAILLE_BLOC)
+            zf.comment = PREFIXE_EMPREINTE + cle.encode("ascii")
+        os.replace(partiel, chemin_zip)
+    finally:
+        if partiel.exists():
+            partiel.unlink()
+    return chemin_zip, False
@@ -0,0 +1,78 @@
+# bench_demarrage.py
+# Mesure reproductible du démarrage à froid de l’application :
+# - temps d’import de chaque module (local ou dépendance), chacun dans un interpréteur neuf
+# - modules lourds (cv2, yt_dlp, numpy) chargés par l’import de main.py : doit rester vide
+# - temps jusqu’au premier rendu (exécution complète de main.py via streamlit.testing)
+# Usage : python bench_demarrage.py [--repetitions N] [--json sortie.json]
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+RACINE = Path(__file__).resolve().parent
+MODULES = ["streamlit", "yt_dlp", "cv2", "numpy",
+           "caches", "binaires", "medias", "encodage", "archives", "manifeste", "cookies", "timelapse",
+           "stockage"]
+MODULES_LOURDS = ["cv2", "yt_dlp", "numpy"]
+
+def _python(code: str) -> str:
+    r = subprocess.run([sys.executable, "-c", code], cwd=str(RACINE), capture_output=True, text=True,
+                       env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1"))
+    if r.returncode != 0:
+        raise RuntimeError(r.stderr.strip().splitlines()[-1] if r.stderr.strip() else f"code {r.returncode}")
+    return r.stdout.strip().splitlines()[-1]
+
+def temps_import(module: str) -> float:
+    """
+    Temps (s) d’un import à froid de module, dans un interpréteur neuf.
+    """
+    return float(_python(f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"))
+
+def premier_rendu() -> dict:
+    """
+    Temps (s) d’une exécution complète de main.py (premier rendu), et modules lourds chargés au passage.
+    """
+    code = (
+        "import sys, time, json\n"
+        "from streamlit.testing.v1 import AppTest\n"
+        "t = time.perf_counter()\n"
+        "at = AppTest.from_file('main.py', default_timeout=300).run()\n"
+        "d = time.perf_counter() - t\n"
+        f"print(json.dumps({{'rendu': d, 'exceptions': len(at.exception), "
+        f"'lourds': [m for m in {MODULES_LOURDS!r} if m in sys.modules]}}))"
+    )
+    return json.loads(_python(code))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark du démarrage à froid")
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--json", type=Path, default=None)
+    args = parser.parse_args()
+
+    resultats = {"imports": {}, "rendu": [], "lourds_au_rendu": []}
+    for module in MODULES:
+        try:
+            mesures = [temps_import(module) for _ in range(args.repetitions)]
+            resultats["imports"][module] = statistics.median(mesures)
+            print(f"import {module:<12} {statistics.median(mesures) * 1000:8.1f} ms")
+        except RuntimeError as e:
+            print(f"import {module:<12} indisponible ({e})")
+
+    for _ in range(args.repetitions):
+        r = premier_rendu()
+        resultats["rendu"].append(r["rendu"])
+        resultats["lourds_au_rendu"] = r["lourds"]
+        if r["exceptions"]:
+            print(f"attention : {r['exceptions']} exception(s) au rendu")
+    print(f"premier rendu       {statistics.median(resultats['rendu']) * 1000:8.1f} ms (médiane de {args.repetitions})")
+    print(f"modules lourds chargés au rendu : {', '.join(resultats['lourds_au_rendu']) or 'aucun'}")
+
+    if args.json:
+        args.json.write_text(json.dumps(resultats, indent=2), encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
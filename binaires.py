@@ -0,0 +1,173 @@
+# binaires.py
+# Résolution des binaires ffmpeg / ffprobe et sondage de leurs capacités :
+# - résolution mémorisée TTL_RESOLUTION s, l’échec aussi (pas de nouvel essai de
+#   téléchargement à chaque appel) : un binaire installé ou remplacé est vu sans redémarrage
+# - ordre : variable d’env, PATH, imageio-ffmpeg, binaire statique déjà en cache, téléchargement
+# - capacités (encodeurs, filtres, version, cœurs) sondées une fois par binaire (chemin, taille,
+#   date) et gardées TTL_CAPACITES s, consultables sans processus
+
+import os
+import re
+import stat
+import shutil
+import tarfile
+import threading
+import subprocess
+from dataclasses import dataclass
+from pathlib import Path
+from typing import FrozenSet, Optional
+
+from caches import memoiser
+
+BASE_DIR = Path("/tmp/appdata")
+CACHE_BINAIRES = BASE_DIR / "ffmpeg-bin"
+URL_FFMPEG_STATIQUE = "https://johnvansickle.com/ffmpeg/releases/ffmpeg-release-amd64-static.tar.xz"
+# Durée de vie (s) d’une résolution (succès comme échec) et des capacités sondées,
+# et délai réseau du téléchargement
+TTL_RESOLUTION = 600
+TTL_CAPACITES = 3600
+DELAI_RESEAU = 30
+
+# Une seule résolution à la fois (le repli télécharge) ; réentrant : ffprobe résout ffmpeg
+_verrou = threading.RLock()
+
+# ---------------- Résolution ----------------
+
+def _telecharger_ffmpeg_statique(dest_dir: Path) -> str:
+    import urllib.request
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    archive = dest_dir / "ffmpeg-release-amd64-static.tar.xz"
+    with urllib.request.urlopen(URL_FFMPEG_STATIQUE, timeout=DELAI_RESEAU) as r, open(archive, "wb") as f:
+        shutil.copyfileobj(r, f)
+    with tarfile.open(archive, "r:xz") as tf:
+        members = [m for m in tf.getmembers() if m.name.endswith("/ffmpeg")]
+        if not members:
+            raise RuntimeError("Archive ffmpeg invalide : binaire non trouvé.")
+        tf.extractall(path=dest_dir)
+    for p in dest_dir.glob("ffmpeg-*-amd64-static/ffmpeg"):
+        p.chmod(p.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        return str(p)
+    raise RuntimeError("Binaire ffmpeg introuvable après extraction.")
+
+def _chercher_ffmpeg() -> Optional[str]:
+    cand = os.environ.get("FFMPEG_BINARY")
+    if cand and Path(cand).exists():
+        return cand
+    which = shutil.which("ffmpeg")
+    if which:
+        return which
+    try:
+        import imageio_ffmpeg
+        p = imageio_ffmpeg.get_ffmpeg_exe()
+        if p and Path(p).exists():
+            return p
+    except Exception:
+        pass
+    for p in CACHE_BINAIRES.glob("ffmpeg-*-amd64-static/ffmpeg"):
+        if p.exists():
+            return str(p)
+    try:
+        return _telecharger_ffmpeg_statique(CACHE_BINAIRES)
+    except Exception:
+        return None
+
+def _chercher_ffprobe() -> Optional[str]:
+    cand = os.environ.get("FFPROBE_BINARY")
+    if cand and Path(cand).exists():
+        return cand
+    which = shutil.which("ffprobe")
+    if which:
+        return which
+    # Les archives statiques livrent ffprobe à côté de ffmpeg
+    try:
+        voisin = Path(chemin_ffmpeg()).with_name("ffprobe")
+    except RuntimeError:
+        return None
+    return str(voisin) if voisin.exists() else None
+
+_CHERCHEURS = {"ffmpeg": _chercher_ffmpeg, "ffprobe": _chercher_ffprobe}
+
+@memoiser(len(_CHERCHEURS), TTL_RESOLUTION)
+def _resolution(nom: str) -> Optional[str]:
+    return _CHERCHEURS[nom]()
+
+def _resoudre(nom: str, message: str) -> str:
+    with _verrou:
+        chemin = _resolution(nom)
+    if chemin is None:
+        raise RuntimeError(message)
+    return chemin
+
+def chemin_ffmpeg() -> str:
+    """
+    Retourne le chemin de ffmpeg, résolu au plus une fois par TTL_RESOLUTION (succès comme échec).
+    """
+    return _resoudre("ffmpeg", "ffmpeg introuvable et fallback impossible (réseau bloqué ?).")
+
+def chemin_ffprobe() -> str:
+    """
+    Retourne le chemin de ffprobe : FFPROBE_BINARY, PATH, puis le dossier du binaire ffmpeg.
+    """
+    return _resoudre("ffprobe", "ffprobe introuvable.")
+
+def oublier() -> None:
+    """
+    Oublie les résolutions et capacités mémorisées (ex. après installation d’un binaire).
+    """
+    _resolution.vider()
+    _sonder.vider()
+
+# ---------------- Capacités ----------------
+
+@dataclass(frozen=True)
+class Capacites:
+    chemin: str
+    version: str
+    encodeurs: FrozenSet[str]
+    filtres: FrozenSet[str]
+    coeurs: int
+
+    def a_encodeur(self, nom: str) -> bool:
+        return nom in self.encodeurs
+
+    def a_filtre(self, nom: str) -> bool:
+        return nom in self.filtres
+
+def _lister(ffmpeg: str, option: str, motif: str) -> FrozenSet[str]:
+    r = subprocess.run([ffmpeg, "-hide_banner", option], capture_output=True, text=True, check=False)
+    return frozenset(m.group(1) for m in re.finditer(motif, r.stdout or "", re.MULTILINE))
+
+@memoiser(4, TTL_CAPACITES)
+def _sonder(ffmpeg: str, taille: int, mtime_ns: int) -> Capacites:
+    # taille / mtime_ns ne servent qu’à la clé du cache : un binaire remplacé est ressondé
+    ver = subprocess.run([ffmpeg, "-version"], capture_output=True, text=True, check=False)
+    return Capacites(
+        chemin=ffmpeg,
+        version=ver.stdout.splitlines()[0] if ver.stdout else "",
+        # « V....D libx264 ... » / « ... scale  V->V  Scale the input ... »
+        encodeurs=_lister(ffmpeg, "-encoders", r"^\s[VAS][A-Z.]{5}\s+(\S+)"),
+        filtres=_lister(ffmpeg, "-filters", r"^\s[A-Z.]{2,3}\s+(\S+)\s+\S+->\S+"),
+        coeurs=os.cpu_count() or 1,
+    )
+
+def capacites() -> Capacites:
+    """
+    Renvoie les capacités du ffmpeg résolu (version, encodeurs, filtres, nombre de cœurs),
+    sondées une fois par binaire et gardées TTL_CAPACITES s. Lève RuntimeError si ffmpeg est
+    introuvable.
+    """
+    ffmpeg = chemin_ffmpeg()
+    try:
+        st = os.stat(ffmpeg)
+    except OSError as e:
+        raise RuntimeError(f"ffmpeg illisible : {e}")
+    return _sonder(ffmpeg, st.st_size, st.st_mtime_ns)
+
+def encodeur_disponible(nom: str) -> bool:
+    """
+    Indique si le ffmpeg résolu sait encoder avec nom (False si ffmpeg est introuvable).
+    """
+    try:
+        return capacites().a_encodeur(nom)
+    except RuntimeError:
+        return False
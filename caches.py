@@ -0,0 +1,78 @@
+# caches.py
+# Mémorisation à l’échelle du processus (partagée entre sessions et threads) :
+# - clé explicite : les arguments de la fonction
+# - taille bornée avec éviction LRU, durée de vie (TTL) par entrée
+# - invalidation ciblée d’une clé, ou vidage d’un seul cache
+# Les exceptions ne sont jamais mémorisées.
+
+import copy
+import time
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Optional
+
+class CacheTTL:
+    """
+    Dictionnaire LRU borné dont les entrées expirent après ttl secondes.
+    """
+    def __init__(self, taille: int, ttl: Optional[float]):
+        self.taille = taille
+        self.ttl = ttl
+        self._donnees: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def lire(self, cle: tuple):
+        with self._verrou:
+            entree = self._donnees.get(cle)
+            if entree is None:
+                raise KeyError(cle)
+            valeur, expire = entree
+            if expire is not None and expire < time.monotonic():
+                del self._donnees[cle]
+                raise KeyError(cle)
+            self._donnees.move_to_end(cle)
+            return valeur
+
+    def ecrire(self, cle: tuple, valeur) -> None:
+        with self._verrou:
+            expire = time.monotonic() + self.ttl if self.ttl is not None else None
+            self._donnees[cle] = (valeur, expire)
+            self._donnees.move_to_end(cle)
+            while len(self._donnees) > self.taille:
+                self._donnees.popitem(last=False)
+
+    def retirer(self, cle: tuple) -> None:
+        with self._verrou:
+            self._donnees.pop(cle, None)
+
+    def vider(self) -> None:
+        with self._verrou:
+            self._donnees.clear()
+
+    def __len__(self) -> int:
+        return len(self._donnees)
+
+def memoiser(taille: int, ttl: Optional[float] = None, copier: bool = False) -> Callable:
+    """
+    Décorateur : mémorise les résultats d’une fonction selon ses arguments positionnels.
+    copier=True renvoie une copie profonde (pour les résultats que l’appelant modifie).
+    La fonction décorée expose invalider(*args) et vider().
+    """
+    def decorer(fonction: Callable) -> Callable:
+        cache = CacheTTL(taille, ttl)
+
+        @wraps(fonction)
+        def enveloppe(*args):
+            try:
+                valeur = cache.lire(args)
+            except KeyError:
+                valeur = fonction(*args)
+                cache.ecrire(args, valeur)
+            return copy.deepcopy(valeur) if copier else valeur
+
+        enveloppe.invalider = lambda *args: cache.retirer(args)
+        enveloppe.vider = cache.vider
+        enveloppe.cache = cache
+        return enveloppe
+    return decorer
@@ -0,0 +1,615 @@
+# encodage.py
+# Opérations d’encodage ffmpeg partagées par le pipeline :
+# - exécution suivie : lecture du flux -progress de ffmpeg (avancement, vitesse, images/s,
+#   ETA) et conservation des dernières lignes de stderr pour les messages d’erreur
+# - découpe intelligente (smart cut) : copie de flux du cœur aligné sur les GOP,
+#   ré-encodage des seuls GOP partiels aux bords, puis concaténation
+# - encodage parallèle : morceaux coupés aux images clés, encodés par plusieurs ffmpeg
+#   simultanés, puis joints par le démultiplexeur concat
+# - exécution simultanée de commandes indépendantes sous un budget global de cœurs
+# - décision de codec : copie de flux, transcodage audio seul ou transcodage complet vers MP4,
+#   choisie d’après le sondage ffprobe de la source
+# - proxy d’aperçu : petit MP4 360p à bas débit des premières secondes, produit une fois par source
+#   et servi depuis le disque
+
+import os
+import re
+import hashlib
+import time
+import logging
+import threading
+import subprocess
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from dataclasses import dataclass, replace
+from functools import partial
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import binaires
+import medias
+
+logger = logging.getLogger(__name__)
+
+# Écart (s) en dessous duquel un bord est considéré comme aligné sur une image clé
+TOLERANCE_BORD = 0.001
+# Durée minimale (s) d’un morceau en encodage parallèle : en dessous, le lancement de
+# processus supplémentaires coûte plus qu’il ne rapporte
+DUREE_MIN_MORCEAU = 60
+# Nombre de lignes de stderr conservées pour expliquer un échec
+LIGNES_STDERR = 40
+# Délai (s) sans avancement au-delà duquel une étape est signalée comme bloquée
+DELAI_BLOCAGE = 60
+
+def budget_coeurs() -> int:
+    """
+    Nombre de cœurs qu’un job peut occuper au total (variable d’env BUDGET_COEURS, sinon tous).
+    """
+    try:
+        return max(1, int(os.environ.get("BUDGET_COEURS", "")))
+    except ValueError:
+        return max(1, os.cpu_count() or 1)
+
+# ---------------- Exécution suivie ----------------
+
+class ErreurFFmpeg(RuntimeError):
+    """
+    Échec d’une commande ffmpeg ; le message reprend la fin de stderr.
+    """
+    def __init__(self, etape: str, code: int, stderr: List[str]):
+        self.etape = etape
+        self.code = code
+        self.stderr = stderr
+        detail = "\n".join(stderr[-5:]) if stderr else "(stderr vide)"
+        super().__init__(f"ffmpeg a échoué ({etape}, code {code}) :\n{detail}")
+
+@dataclass
+class Progression:
+    etape: str
+    temps: float = 0.0                 # secondes de média déjà produites
+    duree: Optional[float] = None      # secondes à produire, si connues
+    vitesse: Optional[float] = None    # facteur temps réel (1.0 = temps réel)
+    images_s: Optional[float] = None
+    eta: Optional[float] = None        # secondes restantes estimées
+    termine: bool = False
+
+    @property
+    def fraction(self) -> Optional[float]:
+        if self.termine:
+            return 1.0
+        if not self.duree:
+            return None
+        return max(0.0, min(1.0, self.temps / self.duree))
+
+    def resume(self) -> str:
+        morceaux = [self.etape]
+        if self.fraction is not None:
+            morceaux.append(f"{self.fraction * 100:.0f} %")
+        if self.vitesse:
+            morceaux.append(f"×{self.vitesse:.2f}")
+        if self.images_s:
+            morceaux.append(f"{self.images_s:.0f} img/s")
+        if self.eta is not None and not self.termine:
+            morceaux.append(f"reste ~{self.eta:.0f} s")
+        return " — ".join(morceaux)
+
+class _Groupe:
+    """
+    Sous-processus ffmpeg des tâches d’un même executer_taches, arrêtés ensemble à la première erreur.
+    """
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._procs: set = set()
+        self.annule = False
+
+    def inscrire(self, proc: subprocess.Popen) -> None:
+        with self._verrou:
+            if not self.annule:
+                self._procs.add(proc)
+                return
+        proc.terminate()  # lancé après l’annulation : arrêté aussitôt
+
+    def retirer(self, proc: subprocess.Popen) -> None:
+        with self._verrou:
+            self._procs.discard(proc)
+
+    def annuler(self) -> None:
+        with self._verrou:
+            self.annule = True
+            procs = list(self._procs)
+        for proc in procs:
+            try:
+                proc.terminate()
+            except OSError:
+                pass
+
+# Groupe de la tâche exécutée par le thread courant (voir executer_taches)
+_contexte = threading.local()
+
+_RE_DUREE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+
+def _nombre(valeur: Optional[str]) -> Optional[float]:
+    try:
+        return float((valeur or "").rstrip("x"))
+    except ValueError:
+        return None
+
+def executer_ffmpeg(args: List[str], etape: str = "ffmpeg", duree: Optional[float] = None,
+                    rappel: Optional[Callable[[Progression], None]] = None,
+                    entree: Optional[Iterable] = None) -> None:
+    """
+    Exécute une commande ffmpeg en lisant son flux -progress sur stdout.
+    À chaque bloc, `rappel` (s’il est fourni) reçoit une Progression (temps produit, vitesse,
+    images/s, ETA). `duree` sert au calcul de l’ETA ; à défaut la durée annoncée par ffmpeg
+    sur stderr est utilisée. `entree` (optionnelle) fournit des blocs d’octets écrits sur stdin
+    par un thread dédié (commande lisant pipe:0) ; une exception levée par `entree` interrompt
+    ffmpeg et est relancée. Lève ErreurFFmpeg avec la fin de stderr en cas d’échec.
+    """
+    cmd = [args[0], "-hide_banner", "-nostats", "-progress", "pipe:1"] + list(args[1:])
+    debut = time.monotonic()
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE if entree is not None else subprocess.DEVNULL,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors="replace")
+    # Lancé par une tâche d’executer_taches : arrêté avec ses voisines à la première erreur
+    groupe: Optional[_Groupe] = getattr(_contexte, "groupe", None)
+    if groupe is not None:
+        groupe.inscrire(proc)
+    erreur_entree: List[BaseException] = []
+
+    def _ecrire_entree():
+        try:
+            for bloc_octets in entree:
+                proc.stdin.buffer.write(bloc_octets)  # stdin est ouvert en texte : on écrit sous le tampon binaire
+        except BrokenPipeError:
+            pass  # ffmpeg s’est arrêté : son code de retour et stderr expliquent pourquoi
+        except BaseException as e:
+            erreur_entree.append(e)
+            proc.kill()
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    ecrivain = None
+    if entree is not None:
+        ecrivain = threading.Thread(target=_ecrire_entree, daemon=True)
+        ecrivain.start()
+    fin_stderr: deque = deque(maxlen=LIGNES_STDERR)
+    duree_annoncee: List[float] = []
+
+    def _lire_stderr():
+        for ligne in proc.stderr:
+            ligne = ligne.rstrip()
+            fin_stderr.append(ligne)
+            if not duree_annoncee:
+                m = _RE_DUREE.search(ligne)
+                if m:
+                    duree_annoncee.append(int(m.group(1)) * 3600 + int(m.group(2)) * 60 + float(m.group(3)))
+
+    lecteur = threading.Thread(target=_lire_stderr, daemon=True)
+    lecteur.start()
+
+    etat = Progression(etape, duree=duree)
+    derniere_avance = time.monotonic()
+    signale = False
+    bloc = {}
+    for ligne in proc.stdout:
+        cle, _, valeur = ligne.strip().partition("=")
+        bloc[cle] = valeur
+        if cle != "progress":
+            continue
+        temps = _nombre(bloc.get("out_time_us") or bloc.get("out_time_ms"))
+        if temps is not None and temps >= 0:
+            temps /= 1_000_000
+            if temps > etat.temps:
+                derniere_avance = time.monotonic()
+                signale = False
+            etat.temps = temps
+        etat.duree = duree or (duree_annoncee[0] if duree_annoncee else None)
+        etat.vitesse = _nombre(bloc.get("speed"))
+        etat.images_s = _nombre(bloc.get("fps"))
+        if etat.duree and etat.vitesse:
+            etat.eta = max(0.0, (etat.duree - etat.temps) / etat.vitesse)
+        etat.termine = valeur == "end"
+        if not signale and time.monotonic() - derniere_avance > DELAI_BLOCAGE:
+            logger.warning("%s : aucun avancement depuis %d s", etape, DELAI_BLOCAGE)
+            signale = True
+        logger.debug("%s", etat.resume())
+        if rappel:
+            rappel(replace(etat))
+        bloc = {}
+
+    code = proc.wait()
+    if groupe is not None:
+        groupe.retirer(proc)
+    lecteur.join()
+    if ecrivain is not None:
+        ecrivain.join()
+    if erreur_entree:
+        raise erreur_entree[0]
+    if code != 0:
+        logger.error("%s : échec (code %d)\n%s", etape, code, "\n".join(fin_stderr))
+        raise ErreurFFmpeg(etape, code, list(fin_stderr))
+    logger.info("%s : terminé en %.1f s (vitesse ×%s)", etape, time.monotonic() - debut,
+                f"{etat.vitesse:.2f}" if etat.vitesse else "?")
+
+# ---------------- Exécution simultanée sous budget ----------------
+
+# Options ffmpeg sans valeur : tout autre argument commençant par « - » consomme le suivant
+OPTIONS_SANS_VALEUR = {"-y", "-n", "-an", "-vn", "-sn", "-dn", "-nostdin", "-nostats", "-hide_banner",
+                       "-noautorotate", "-autorotate", "-shortest", "-copyts", "-re"}
+
+def _positions_sorties(cmd: List[str]) -> List[int]:
+    # Indices des fichiers de sortie : arguments qui ne sont ni une option ni la valeur d’une option
+    positions, i = [], 1
+    while i < len(cmd):
+        if cmd[i].startswith("-") and cmd[i] != "-":
+            i += 1 if cmd[i] in OPTIONS_SANS_VALEUR else 2
+        else:
+            positions.append(i)
+            i += 1
+    return positions
+
+def _limiter_threads(cmd: List[str], threads: str) -> List[str]:
+    # -threads avant chaque -i (décodage) et avant chaque fichier de sortie (encodage : un graphe
+    # d’extraction d’images en a plus de 25), et threads des graphes de filtres (options globales)
+    cmd = list(cmd)
+    for i in reversed(_positions_sorties(cmd)):
+        cmd[i:i] = ["-threads", threads]
+    for i in reversed([i for i, a in enumerate(cmd) if a == "-i" and cmd[i - 1] != "-threads"]):
+        cmd[i:i] = ["-threads", threads]
+    globales = ["-filter_threads", threads]
+    if "-filter_complex" in cmd or "-lavfi" in cmd:
+        globales += ["-filter_complex_threads", threads]
+    return cmd[:1] + globales + cmd[1:]
+
+def executer_taches(taches: List[Callable[[Callable[[Progression], None]], object]], etapes: List[str],
+                    durees: Optional[List[Optional[float]]] = None, nb_simultanes: Optional[int] = None,
+                    rappel: Optional[Callable[[List[Progression]], None]] = None) -> list:
+    """
+    Exécute des tâches simultanément dans un pool de threads (au plus nb_simultanes à la fois,
+    toutes par défaut). Chaque tâche reçoit une fonction `noter(Progression)` pour signaler son
+    avancement ; `rappel` reçoit la liste des Progression et n’est appelé que depuis le thread
+    appelant (compatible Streamlit). Renvoie les résultats dans l’ordre des tâches. À la première
+    erreur (ou si l’appelant est interrompu), les tâches pas encore commencées sont annulées et
+    les ffmpeg en cours (lancés par executer_ffmpeg) arrêtés, puis cette première erreur est levée.
+    """
+    if not taches:
+        return []
+    durees = durees or [None] * len(taches)
+    etats = [Progression(e, duree=d) for e, d in zip(etapes, durees)]
+    verrou = threading.Lock()
+    groupe = _Groupe()
+    erreurs: List[BaseException] = []
+
+    def _executer(i: int):
+        def _noter(etat: Progression):
+            with verrou:
+                etats[i] = etat
+        _contexte.groupe = groupe
+        try:
+            resultat = taches[i](_noter)
+        except BaseException as e:
+            with verrou:
+                if not groupe.annule:
+                    erreurs.append(e)  # les échecs dus à l’annulation ne masquent pas la cause
+            groupe.annuler()
+            raise
+        finally:
+            _contexte.groupe = None
+        with verrou:
+            etats[i].termine = True
+        return resultat
+
+    with ThreadPoolExecutor(max_workers=max(1, min(len(taches), nb_simultanes or len(taches)))) as pool:
+        futurs = [pool.submit(_executer, i) for i in range(len(taches))]
+        try:
+            en_cours = set(futurs)
+            while en_cours and not groupe.annule:
+                _, en_cours = wait(en_cours, timeout=0.5, return_when=FIRST_EXCEPTION)
+                if rappel:
+                    with verrou:
+                        copie = [replace(e) for e in etats]
+                    rappel(copie)
+        except BaseException:
+            groupe.annuler()
+            raise
+        finally:
+            if groupe.annule:
+                for futur in futurs:
+                    futur.cancel()
+    if erreurs:
+        raise erreurs[0]
+    return [futur.result() for futur in futurs]
+
+def executer_en_parallele(commandes: List[List[str]], budget: Optional[int] = None,
+                          etapes: Optional[List[str]] = None, durees: Optional[List[Optional[float]]] = None,
+                          rappel: Optional[Callable[[List[Progression]], None]] = None) -> None:
+    """
+    Exécute des commandes ffmpeg indépendantes simultanément en se partageant `budget` cœurs
+    (budget_coeurs() par défaut) : au plus `budget` processus à la fois, chacun limité à sa part
+    par -threads (chaque entrée, chaque sortie et les graphes de filtres). Les options sans
+    valeur employées doivent figurer dans OPTIONS_SANS_VALEUR (repérage des sorties).
+    Les threads du pool ne font qu’attendre les sous-processus (voir executer_taches).
+    Lève la première erreur.
+    """
+    if not commandes:
+        return
+    budget = max(1, budget or budget_coeurs())
+    nb_simultanes = min(len(commandes), budget)
+    threads = str(max(1, budget // nb_simultanes))
+    etapes = etapes or [f"sortie {i + 1}" for i in range(len(commandes))]
+    durees = durees or [None] * len(commandes)
+
+    def _tache(i: int, noter: Callable[[Progression], None]):
+        executer_ffmpeg(_limiter_threads(commandes[i], threads), etapes[i], durees[i], noter)
+
+    executer_taches([partial(_tache, i) for i in range(len(commandes))], etapes, durees, nb_simultanes, rappel)
+
+# ---------------- Décision de codec (cible MP4) ----------------
+
+# Flux vidéo repris tels quels dans un MP4 lisible partout : H.264 8 bits 4:2:0
+CODECS_VIDEO_MP4 = {"h264"}
+PIX_FMTS_MP4 = {"yuv420p", "yuvj420p"}
+PROFILS_VIDEO_EXCLUS = {"High 10", "High 4:2:2", "High 4:4:4 Predictive", "High 10 Intra",
+                        "High 4:2:2 Intra", "High 4:4:4 Intra"}
+CODECS_AUDIO_MP4 = {"aac", "mp3"}
+ARGS_VIDEO_HD = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "18", "-pix_fmt", "yuv420p"]
+ARGS_AUDIO_HD = ["-c:a", "aac", "-b:a", "192k"]
+# Premier flux vidéo et premier flux audio éventuel seulement : les sous-titres et flux de données
+# (WebM / MKV de yt-dlp, uploads) feraient échouer le multiplexage MP4
+ARGS_CARTE_MP4 = ["-map", "0:v:0", "-map", "0:a:0?", "-sn", "-dn", "-map_metadata", "0"]
+
+@dataclass(frozen=True)
+class DecisionCodec:
+    mode: str                # "copie", "audio" (transcodage audio seul) ou "complet"
+    args: List[str]          # arguments de codec à placer avant le fichier de sortie
+    raison: str
+
+    @property
+    def etape(self) -> str:
+        return {"copie": "remux", "audio": "transcodage audio"}.get(self.mode, "transcodage")
+
+def _video_compatible_mp4(video: dict) -> bool:
+    return (video.get("codec_name") in CODECS_VIDEO_MP4
+            and (video.get("pix_fmt") or "yuv420p") in PIX_FMTS_MP4
+            and video.get("profile") not in PROFILS_VIDEO_EXCLUS)
+
+def transcodage_complet(raison: str) -> DecisionCodec:
+    """
+    Décision de transcodage complet (H.264 + AAC) : repli quand la source ne peut être sondée,
+    ou quand une copie de flux a échoué.
+    """
+    return DecisionCodec("complet", ARGS_CARTE_MP4 + ARGS_VIDEO_HD + ARGS_AUDIO_HD, raison)
+
+def _flux_source(src: str) -> Tuple[dict, ...]:
+    # Flux décrits par ffprobe, ou à défaut par l’en-tête de `ffmpeg -i` (ffprobe absent)
+    try:
+        return medias.infos(src).flux
+    except RuntimeError:
+        return medias.flux_ffmpeg(src)
+
+def decision_mp4(src: str, coupe: bool = False) -> DecisionCodec:
+    """
+    Choisit comment produire un MP4 « HD » depuis src d’après ffprobe, ou à défaut l’en-tête
+    de `ffmpeg -i` (conteneur, codecs, format de pixels, profil) : copie de flux (remux),
+    transcodage de l’audio seul, ou transcodage complet. Si la source ne peut être sondée, le
+    transcodage complet est retenu. Seuls le premier flux vidéo et le premier flux audio sont gardés.
+    coupe=True : la sortie est coupée à un intervalle ; la vidéo n’est alors jamais copiée
+    (une copie coupée démarre à l’image clé précédente), pour une coupe à l’image près.
+    """
+    try:
+        flux = _flux_source(src)
+    except Exception as e:
+        return transcodage_complet(f"sondage impossible ({e})")
+    video = next((f for f in flux if f.get("codec_type") == "video"), None)
+    audio = next((f for f in flux if f.get("codec_type") == "audio"), None)
+    if not video:
+        raise ValueError(f"Aucun flux vidéo dans {Path(src).name}.")
+
+    desc_video = "/".join(str(v) for v in (video.get("codec_name"), video.get("profile"), video.get("pix_fmt")) if v)
+    desc_audio = audio.get("codec_name") if audio else "sans audio"
+    audio_ok = audio is None or audio.get("codec_name") in CODECS_AUDIO_MP4
+    args_audio = ["-c:a", "copy"] if audio_ok else ARGS_AUDIO_HD
+    if _video_compatible_mp4(video) and coupe:
+        return DecisionCodec("complet", ARGS_CARTE_MP4 + ARGS_VIDEO_HD + args_audio,
+                             f"{desc_video} transcodé pour une coupe à l’image près"
+                             + ("" if audio_ok else f", audio {desc_audio} en AAC"))
+    if _video_compatible_mp4(video):
+        if audio_ok:
+            return DecisionCodec("copie", ARGS_CARTE_MP4 + ["-c", "copy"],
+                                 f"{desc_video} + {desc_audio} : copie de flux")
+        return DecisionCodec("audio", ARGS_CARTE_MP4 + ["-c:v", "copy"] + args_audio,
+                             f"{desc_video} copié, audio {desc_audio} transcodé en AAC")
+    return DecisionCodec("complet", ARGS_CARTE_MP4 + ARGS_VIDEO_HD + args_audio,
+                         f"vidéo {desc_video} transcodée en H.264"
+                         + ("" if audio_ok else f", audio {desc_audio} en AAC"))
+
+# ---------------- Découpe intelligente ----------------
+
+def decoupe_intelligente(ffmpeg: str, src: str, debut: float, fin: float, cible: str,
+                         rappel: Optional[Callable[[Progression], None]] = None) -> bool:
+    """
+    Découpe [debut, fin] de src vers cible à l’image près en ne ré-encodant que les bords :
+    [debut, k1) et [k2, fin) sont ré-encodés (libx264), [k1, k2) est copié tel quel,
+    k1/k2 étant la première et la dernière image clé de l’intervalle.
+    Renvoie False (sans rien écrire) si la source ne s’y prête pas : ffprobe absent,
+    libx264 absent, vidéo non H.264, audio non AAC, ou moins de deux images clés dans
+    l’intervalle (rien à copier : l’appelant ré-encode tout l’intervalle, cf. decision_mp4(coupe=True)).
+    """
+    if not binaires.encodeur_disponible("libx264"):
+        return False
+    try:
+        video = medias.flux_video(src)
+        audio = medias.flux_audio(src)
+        paquets = medias.paquets_video(src)
+    except Exception:
+        return False
+    if not video or video.get("codec_name") != "h264":
+        return False
+    if audio and audio.get("codec_name") != "aac":
+        return False
+    dans_intervalle = [t for t, cle in paquets if cle and debut - TOLERANCE_BORD <= t <= fin + TOLERANCE_BORD]
+    if len(dans_intervalle) < 2:
+        return False
+    k1, k2 = dans_intervalle[0], dans_intervalle[-1]
+    # Nombre exact d’images du cœur copié : en copie, -t seul laisserait passer les premières
+    # images du GOP suivant (réordonnancement des images B)
+    nb_images_coeur = sum(1 for t, _ in paquets if k1 - TOLERANCE_BORD <= t < k2 - TOLERANCE_BORD)
+
+    # Bords ré-encodés avec le même format de pixels / audio pour rester concaténables
+    args_video = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "18", "-pix_fmt", video.get("pix_fmt") or "yuv420p"]
+    args_audio = []
+    if audio:
+        args_audio = ["-c:a", "aac", "-b:a", "192k"]
+        if audio.get("sample_rate"):
+            args_audio += ["-ar", str(audio["sample_rate"])]
+        if audio.get("channels"):
+            args_audio += ["-ac", str(audio["channels"])]
+
+    with tempfile.TemporaryDirectory(dir=str(Path(cible).parent)) as tmp:
+        parties: List[Path] = []
+
+        def _partie(nom: str, t0: float, duree: float, codec: List[str]):
+            # Segments intermédiaires en MPEG-TS : paramètres H.264 en bande, concaténation sûre
+            sortie = Path(tmp) / f"{nom}.ts"
+            executer_ffmpeg([ffmpeg, "-y", "-ss", f"{t0:.6f}", "-i", src, "-t", f"{duree:.6f}",
+                             "-map", "0:v:0", "-map", "0:a:0?"] + codec +
+                            ["-bsf:v", "h264_mp4toannexb", "-f", "mpegts", str(sortie)],
+                            f"découpe : {nom}", duree, rappel)
+            parties.append(sortie)
+
+        try:
+            if k1 - debut > TOLERANCE_BORD:
+                _partie("debut", debut, k1 - debut, args_video + args_audio)
+            # Copie : -ss légèrement après k1 pour que la recherche tombe sur k1 et pas la clé précédente
+            _partie("milieu", k1 + TOLERANCE_BORD, k2 - k1, ["-c", "copy", "-frames:v", str(nb_images_coeur)])
+            if fin - k2 > TOLERANCE_BORD:
+                _partie("fin", k2, fin - k2, args_video + args_audio)
+
+            liste = Path(tmp) / "parties.txt"
+            liste.write_text("".join(f"file '{p}'\n" for p in parties), encoding="utf-8")
+            executer_ffmpeg([ffmpeg, "-y", "-f", "concat", "-safe", "0", "-i", str(liste),
+                             "-c", "copy", "-movflags", "+faststart", str(cible)],
+                            "découpe : assemblage", fin - debut, rappel)
+        except Exception as e:
+            logger.warning("Découpe intelligente abandonnée : %s", e)
+            return False
+    return True
+
+# ---------------- Encodage parallèle par morceaux ----------------
+
+def nb_morceaux_par_defaut(duree: float) -> int:
+    """
+    Nombre de morceaux pour une durée donnée : un par cœur du budget, sans descendre sous DUREE_MIN_MORCEAU.
+    """
+    return max(1, min(budget_coeurs(), int(duree // DUREE_MIN_MORCEAU)))
+
+def _bornes_morceaux(cles: List[float], debut: float, fin: float, nb: int) -> List[float]:
+    # Bornes [debut, c1, ..., fin] : pour chaque coupe idéale, l’image clé la plus proche
+    bornes = [debut]
+    candidates = [k for k in cles if debut + TOLERANCE_BORD < k < fin - TOLERANCE_BORD]
+    for i in range(1, nb):
+        if not candidates:
+            break
+        ideal = debut + i * (fin - debut) / nb
+        k = min(candidates, key=lambda c: abs(c - ideal))
+        if k > bornes[-1] + TOLERANCE_BORD:
+            bornes.append(k)
+    bornes.append(fin)
+    return bornes
+
+def encoder_parallele(ffmpeg: str, src: str, cible: str, filtre_video: str, args_video: List[str],
+                      args_audio: List[str], debut: Optional[float] = None, fin: Optional[float] = None,
+                      nb_morceaux: Optional[int] = None,
+                      rappel: Optional[Callable[[List[Progression]], None]] = None) -> bool:
+    """
+    Encode [debut, fin] de src (toute la vidéo par défaut) vers cible en N morceaux simultanés.
+    Les morceaux commencent sur des images clés (recherche sans décodage perdu), et sont encodés
+    par executer_en_parallele sous le budget de cœurs ; l’audio est encodé à part en parallèle, puis le tout
+    est joint sans ré-encodage. Renvoie False si la vidéo est trop courte pour en tirer parti
+    ou si le sondage échoue : l’appelant encode alors en un seul processus.
+    """
+    try:
+        cles = medias.images_cles(src)
+        avec_audio = medias.flux_audio(src) is not None
+        if fin is None:
+            fin = medias.duree(src)
+    except Exception:
+        return False
+    debut = float(debut or 0)
+    if not fin or fin <= debut:
+        return False
+    nb = nb_morceaux or nb_morceaux_par_defaut(fin - debut)
+    bornes = _bornes_morceaux(cles, debut, float(fin), nb)
+    if len(bornes) < 3:
+        return False
+    nb = len(bornes) - 1
+
+    with tempfile.TemporaryDirectory(dir=str(Path(cible).parent)) as tmp:
+        morceaux = [Path(tmp) / f"morceau_{i:03d}.mp4" for i in range(nb)]
+        audio = Path(tmp) / "audio.m4a"
+        commandes, etapes, durees = [], [], []
+        for i, sortie in enumerate(morceaux):
+            t0, t1 = bornes[i], bornes[i + 1]
+            commandes.append([ffmpeg, "-y", "-ss", f"{t0:.6f}", "-i", src, "-t", f"{t1 - t0:.6f}",
+                              "-map", "0:v:0", "-an", "-vf", filtre_video] + args_video + [str(sortie)])
+            etapes.append(f"morceau {i + 1}/{nb}")
+            durees.append(t1 - t0)
+        if avec_audio:
+            commandes.append([ffmpeg, "-y", "-ss", f"{debut:.6f}", "-i", src, "-t", f"{fin - debut:.6f}",
+                              "-map", "0:a:0", "-vn"] + args_audio + [str(audio)])
+            etapes.append("audio")
+            durees.append(fin - debut)
+        try:
+            executer_en_parallele(commandes, etapes=etapes, durees=durees, rappel=rappel)
+            liste = Path(tmp) / "morceaux.txt"
+            liste.write_text("".join(f"file '{m}'\n" for m in morceaux), encoding="utf-8")
+            entrees = ["-f", "concat", "-safe", "0", "-i", str(liste)]
+            cartes = ["-map", "0:v:0"]
+            if avec_audio:
+                entrees += ["-i", str(audio)]
+                cartes += ["-map", "1:a:0"]
+            executer_ffmpeg([ffmpeg, "-y"] + entrees + cartes + ["-c", "copy", "-movflags", "+faststart", str(cible)],
+                            "assemblage des morceaux", fin - debut)
+        except Exception as e:
+            logger.warning("Encodage parallèle abandonné, repli sur un seul processus : %s", e)
+            return False
+    return True
+
+# ---------------- Proxy d’aperçu ----------------
+
+# 360p au plus (jamais d’agrandissement), hauteur paire pour x264 ; seules les DUREE_MAX_APERCU
+# premières secondes sont transcodées : le proxy est produit avant l’affichage du bouton de traitement
+DUREE_MAX_APERCU = 60
+FILTRE_APERCU = "scale=-2:'trunc(min(360,ih)/2)*2'"
+ARGS_APERCU = ["-c:v", "libx264", "-preset", "ultrafast", "-crf", "30", "-maxrate", "600k", "-bufsize", "1200k",
+               "-pix_fmt", "yuv420p", "-c:a", "aac", "-b:a", "64k", "-ac", "2", "-movflags", "+faststart"]
+
+def proxy_apercu(ffmpeg: str, src: str, dossier: Path,
+                 rappel: Optional[Callable[[Progression], None]] = None) -> Path:
+    """
+    Renvoie le proxy d’aperçu de src (360p, preset ultrafast, bas débit, DUREE_MAX_APERCU premières
+    secondes) rangé dans dossier, en le produisant s’il n’existe pas encore. Le nom dépend du chemin, de la taille et de la date
+    de modification de la source : un proxy n’est jamais refait pour une source inchangée.
+    """
+    p = Path(src).resolve()
+    s = p.stat()
+    cle = hashlib.sha1(f"{p}|{s.st_size}|{s.st_mtime_ns}|{DUREE_MAX_APERCU}".encode("utf-8")).hexdigest()[:16]
+    dossier = Path(dossier)
+    dossier.mkdir(parents=True, exist_ok=True)
+    cible = dossier / f"apercu_{cle}.mp4"
+    if cible.exists():
+        return cible
+    # Nom partiel propre au processus et au thread : deux sessions sur la même source ne
+    # suppriment pas le fichier en cours de l’autre
+    partiel = dossier / f"apercu_{cle}_{os.getpid()}_{threading.get_ident()}.part.mp4"
+    try:
+        executer_ffmpeg([ffmpeg, "-y", "-i", str(p), "-t", str(DUREE_MAX_APERCU), "-vf", FILTRE_APERCU]
+                        + ARGS_APERCU + [str(partiel)], "aperçu 360p", DUREE_MAX_APERCU, rappel)
+        os.replace(partiel, cible)
+    finally:
+        if partiel.exists():
+            partiel.unlink()
+    return cible
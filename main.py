@@ -6,73 +6,129 @@
 # Toutes les fonctionnalités précédentes sont conservées.
 
 import os
+import sys
 os.environ["STREAMLIT_SERVER_FILE_WATCHER_TYPE"] = "none"
 
 import streamlit as st
-import subprocess
 import re
-import glob
 import unicodedata
 import shutil
-import zipfile
+from dataclasses import dataclass, replace
 from pathlib import Path
+import time
 import hashlib
+import threading
+import logging
 import importlib.util
-import cv2
 
-from yt_dlp import YoutubeDL
-from yt_dlp.utils import DownloadError
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
 
 # ---------------- Imports locaux ----------------
 
-def _import_timelapse():
+def _import_local(nom: str):
+    # Importe un module voisin (nom.py), avec repli sur un chargement par chemin
     try:
-        import timelapse as tl
-        return tl
+        return importlib.import_module(nom)
     except Exception:
-        spec = importlib.util.spec_from_file_location("timelapse", str(Path("timelapse.py").resolve()))
+        spec = importlib.util.spec_from_file_location(nom, str(Path(f"{nom}.py").resolve()))
         m = importlib.util.module_from_spec(spec)
+        sys.modules[nom] = m
         spec.loader.exec_module(m)  # type: ignore
         return m
 
-tl = _import_timelapse()
-
-def _import_cookies():
-    try:
-        import cookies as ck
-        return ck
-    except Exception:
-        spec = importlib.util.spec_from_file_location("cookies", str(Path("cookies.py").resolve()))
-        m = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(m)  # type: ignore
-        return m
-
-ck = _import_cookies()
+bn = _import_local("binaires")
+tl = _import_local("timelapse")
+ck = _import_local("cookies")
+enc = _import_local("encodage")
+md = _import_local("medias")
+ar = _import_local("archives")
+mf = _import_local("manifeste")
+cache = _import_local("caches")
+stk = _import_local("stockage")
 
 # ---------------- Répertoires ----------------
 
 BASE_DIR = Path("/tmp/appdata")
 REPERTOIRE_SORTIE = BASE_DIR / "fichiers"
 REPERTOIRE_TEMP = BASE_DIR / "tmp"
+REPERTOIRE_APERCUS = REPERTOIRE_TEMP / "apercus"
 REPERTOIRE_SORTIE.mkdir(parents=True, exist_ok=True)
 REPERTOIRE_TEMP.mkdir(parents=True, exist_ok=True)
+# Éviction LRU sous quota / âge maximal, dans un thread de fond, au plus une fois toutes les quelques minutes (voir stockage.py)
+stk.nettoyer_periodiquement()
 
 # ---------------- Constantes UI / limites ----------------
 
-SEUIL_APERCU_OCTETS = 160 * 1024 * 1024
 LONGUEUR_TITRE_MAX = 24
 LONGUEUR_PREFIX_ID = 8
+TAILLE_BLOC_UPLOAD = 8 * 1024 * 1024
+
+# ---------------- Profil d’encodage « Compressée » ----------------
+
+QUALITE_COMPRESSEE = "Compressée (1280p, CRF 28)"
+# Paramètres communs à la vidéo de base compressée et à la sortie MP4 : si la base a été
+# produite avec ce profil, la sortie MP4 la réutilise au lieu de la ré-encoder.
+PROFIL_COMPRESSE = {"largeur": 1280, "preset": "slow", "crf": 28, "audio": "96k"}
+ARGS_VIDEO_COMPRESSEE = ["-c:v", "libx264", "-preset", PROFIL_COMPRESSE["preset"], "-crf", str(PROFIL_COMPRESSE["crf"])]
+ARGS_AUDIO_COMPRESSEE = ["-c:a", "aac", "-b:a", PROFIL_COMPRESSE["audio"]]
+FILTRE_COMPRESSE = f"scale={PROFIL_COMPRESSE['largeur']}:-2"
+
+# ---------------- Sorties audio / images ----------------
+
+ARGS_MP3 = ["-acodec", "libmp3lame", "-q:a", "5"]
+ARGS_WAV = ["-acodec", "adpcm_ima_wav"]
+# Au plus 1920x1080, proportions conservées, jamais d’agrandissement
+FILTRE_IMAGES = "scale=w='min(1920,iw)':h='min(1080,ih)':force_original_aspect_ratio=decrease"
+# Sorties image nommées directement par leur PTS (en secondes) : pas de renommage a posteriori
+ARGS_IMAGES = ["-fps_mode", "passthrough", "-enc_time_base", "1", "-frame_pts", "1", "-q:v", "1"]
+
+# ---------------- Intervalle temporel ----------------
+
+@dataclass(frozen=True)
+class Intervalle:
+    # Intervalle [debut, fin] (secondes, repère de la source d’origine) transporté de bout en bout.
+    # `coupe_par` mémorise l’étape qui a déjà découpé le fichier courant ("telechargement" ou
+    # "preparation") : ce fichier est alors en repère local (t=0 correspond à `debut`) et
+    # les étapes suivantes ne doivent ni rechercher ni redécouper.
+    debut: int
+    fin: int
+    coupe_par: str | None = None
+
+    @property
+    def duree(self) -> int:
+        return max(0, self.fin - self.debut)
+
+    @property
+    def deja_coupe(self) -> bool:
+        return self.coupe_par is not None
+
+    def args_coupe(self) -> list:
+        # Arguments d’entrée ffmpeg pour appliquer la coupe (vide si déjà appliquée)
+        if self.deja_coupe:
+            return []
+        return ["-ss", str(self.debut), "-to", str(self.fin)]
+
+    def coupe(self, etape: str) -> "Intervalle":
+        # Renvoie l’intervalle marqué comme appliqué par `etape`
+        return replace(self, coupe_par=etape)
+
+def args_coupe(intervalle: Intervalle | None) -> list:
+    # Arguments de coupe à placer avant -i (aucun pour la vidéo entière)
+    return intervalle.args_coupe() if intervalle else []
 
 # ---------------- Utilitaires généraux ----------------
 
-def vider_cache():
-    # Nettoyage du cache Streamlit
-    st.cache_data.clear()
+def date_modification(p: Path | None):
+    # Date de modification (ns) d’un fichier, ou None : sert de clé d’invalidation des caches
+    try:
+        return p.stat().st_mtime_ns if p else None
+    except OSError:
+        return None
 
 def ffmpeg_disponible() -> bool:
-    # Vérifie la disponibilité de ffmpeg via timelapse.chemin_ffmpeg()
+    # Vérifie la disponibilité de ffmpeg (résolution mémorisée, succès comme échec)
     try:
-        _ = tl.chemin_ffmpeg()
+        _ = bn.chemin_ffmpeg()
         return True
     except Exception:
         return False
@@ -110,68 +166,147 @@ def renommer_sans_collision(src_path: Path, dest_path_base: Path, ext: str = ".m
     shutil.move(str(src_path), str(candidat))
     return candidat
 
-def taille_fichier(p: Path):
-    # Taille d’un fichier (ou None)
+def liberer_cible(p: Path):
+    # Supprime une cible avant réécriture : un lien physique vers elle (sortie MP4 réutilisée)
+    # ne doit pas être tronqué par ffmpeg -y
     try:
-        return p.stat().st_size
-    except Exception:
-        return None
+        p.unlink()
+    except FileNotFoundError:
+        pass
 
-def duree_video_seconds(video_path: Path):
-    # Durée en secondes d’une vidéo via OpenCV
+def lier_ou_copier(src: Path, dst: Path) -> Path:
+    # Crée dst comme lien physique vers src (copie si le système de fichiers le refuse)
+    liberer_cible(dst)
     try:
-        cap = cv2.VideoCapture(str(video_path))
-        if not cap.isOpened():
-            return None
-        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
-        frames = cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0
-        cap.release()
-        return int(round(frames / fps)) if fps > 0 else None
-    except Exception:
-        return None
+        os.link(str(src), str(dst))
+    except OSError:
+        shutil.copy2(str(src), str(dst))
+    return dst
+
+def ingerer_upload(fichier, repertoire: Path):
+    # Copie un fichier envoyé sur disque par blocs en calculant son empreinte SHA-256 au passage ;
+    # le fichier est rangé sous son empreinte, donc un contenu identique n’est stocké qu’une fois.
+    # Renvoie (chemin, empreinte).
+    h = hashlib.sha256()
+    partiel = repertoire / f"upload_{os.getpid()}_{threading.get_ident()}.part"
+    try:
+        fichier.seek(0)
+        with open(partiel, "wb") as g:
+            while True:
+                bloc = fichier.read(TAILLE_BLOC_UPLOAD)
+                if not bloc:
+                    break
+                h.update(bloc)
+                g.write(bloc)
+        empreinte = h.hexdigest()
+        cible = repertoire / f"upload_{empreinte[:32]}{Path(fichier.name).suffix.lower() or '.mp4'}"
+        if cible.exists():
+            partiel.unlink()
+        else:
+            os.replace(partiel, cible)
+    finally:
+        if partiel.exists():
+            partiel.unlink()
+    return cible, empreinte
 
 def zipper_sur_disque(fichiers, chemin_zip: Path) -> Path:
-    # Crée un zip avec la liste de fichiers fournie
-    with zipfile.ZipFile(str(chemin_zip), "w", compression=zipfile.ZIP_DEFLATED) as zf:
-        for f in fichiers:
-            f = Path(f)
-            if f.is_file():
-                zf.write(str(f), arcname=f.name)
+    # Crée (ou réutilise si les membres n’ont pas changé) le zip des fichiers fournis :
+    # médias stockés sans recompression, WAV et texte dégonflés
+    chemin_zip, _ = ar.construire_zip(fichiers, chemin_zip, racine=REPERTOIRE_SORTIE)
     return chemin_zip
 
+def bouton_telechargement(libelle: str, chemin: Path, mime: str):
+    # Bouton de téléchargement différé : le fichier n’est lu qu’au clic (pas à chaque rerun),
+    # et le clic ne relance pas le script
+    chemin = Path(chemin)
+    stk.toucher(chemin)
+    st.download_button(libelle, data=chemin.read_bytes, file_name=chemin.name, mime=mime, on_click="ignore")
+
 def lister_sorties(prefix: str):
-    # Liste l’ensemble des sorties correspondant au préfixe
-    patterns = [
-        str(REPERTOIRE_SORTIE / f"{prefix}*.mp4"),
-        str(REPERTOIRE_SORTIE / f"{prefix}*.mp3"),
-        str(REPERTOIRE_SORTIE / f"{prefix}*.wav"),
-        str(REPERTOIRE_SORTIE / f"img1_{prefix}" / "i_*.jpg"),
-        str(REPERTOIRE_SORTIE / f"img25_{prefix}" / "i_*.jpg"),
-        str(REPERTOIRE_SORTIE / f"img1_full_{prefix}" / "i_*.jpg"),
-        str(REPERTOIRE_SORTIE / f"img25_full_{prefix}" / "i_*.jpg"),
-    ]
-    files = []
-    for pat in patterns:
-        files.extend(glob.glob(pat))
-    files = [Path(p) for p in files]
-    files.sort(key=lambda p: p.stat().st_mtime if p.exists() else 0, reverse=True)
-    return files
-
-def hash_job(source_id: str, fps: int, intervalle):
-    # Crée un identifiant de job timelapse déterministe
+    # Liste les sorties du job (manifeste), les plus récentes en premier
+    return mf.fichiers(REPERTOIRE_SORTIE, prefix)
+
+def enregistrer_sorties(base_court: str, fichiers, etape: str, intervalle: Intervalle | None):
+    # Inscrit des sorties au manifeste du job avec leur plage temporelle
+    mf.enregistrer(REPERTOIRE_SORTIE, base_court, fichiers, etape,
+                   intervalle.debut if intervalle else None, intervalle.fin if intervalle else None)
+
+def hash_job(source_id: str, fps: int, intervalle, mouvement=None):
+    # Crée un identifiant de job timelapse déterministe ; mouvement = (seuil, écart max) en mode adaptatif
     h = hashlib.sha1()
     h.update(source_id.encode("utf-8"))
     h.update(str(fps).encode("utf-8"))
     if intervalle:
         h.update(f"{intervalle[0]}-{intervalle[1]}".encode("utf-8"))
+    if mouvement:
+        h.update(f"mouvement:{mouvement[0]}:{mouvement[1]}".encode("utf-8"))
     return h.hexdigest()[:16]
 
+# ---------------- Suivi des commandes ffmpeg ----------------
+
+# Zone d’affichage de la progression, créée au lancement du traitement (None en dehors)
+zone_progression = None
+
+def afficher_progression(etat):
+    # Affiche l’avancement d’une ou plusieurs étapes ffmpeg : barre, vitesse, images/s, ETA
+    if zone_progression is None:
+        return
+    etats = etat if isinstance(etat, list) else [etat]
+    with zone_progression.container():
+        for e in etats:
+            st.progress(e.fraction if e.fraction is not None else 0.0, text=e.resume())
+
+def duree_a_traiter(intervalle: Intervalle | None):
+    # Durée (s) lue par une commande coupée par `intervalle` ; None = durée du fichier (lue par ffmpeg)
+    return intervalle.duree if intervalle and not intervalle.deja_coupe else None
+
+def _run_ffmpeg(args, etape: str = "ffmpeg", duree=None):
+    # Exécute ffmpeg avec suivi de progression (UI + journal) ; l’erreur levée reprend la fin de stderr
+    enc.executer_ffmpeg(args, etape, duree, afficher_progression)
+
+# ---------------- Encodage HD / compressé ----------------
+
+def encoder_hd(ffmpeg: str, src: str, cible: Path, intervalle: Intervalle | None):
+    # Produit le MP4 « HD » : copie de flux, transcodage audio seul ou transcodage complet,
+    # selon la décision prise d’après le sondage ; transcodage complet si la copie échoue quand même.
+    # Intervalle à couper ici : vidéo ré-encodée (une copie de flux démarrerait à l’image clé précédente)
+    decision = enc.decision_mp4(str(src), coupe=bool(args_coupe(intervalle)))
+    st.write(f"Préparation HD : {decision.raison}.")
+    commande = [ffmpeg, "-y"] + args_coupe(intervalle) + ["-i", str(src)]
+    try:
+        _run_ffmpeg(commande + decision.args + ["-movflags", "+faststart", str(cible)],
+                    decision.etape, duree_a_traiter(intervalle))
+    except enc.ErreurFFmpeg as e:
+        if decision.mode == "complet":
+            raise
+        decision = enc.transcodage_complet(f"copie de flux refusée ({(str(e).strip().splitlines() or ['?'])[-1]})")
+        st.write(f"Préparation HD : {decision.raison}, transcodage complet.")
+        _run_ffmpeg(commande + decision.args + ["-movflags", "+faststart", str(cible)],
+                    decision.etape, duree_a_traiter(intervalle))
+
+def encoder_compresse(ffmpeg: str, src: str, cible: Path, intervalle: Intervalle | None, parallele: bool):
+    # Encode src selon PROFIL_COMPRESSE vers cible. En mode parallèle, la vidéo est découpée aux
+    # images clés et encodée en morceaux simultanés (un par cœur) ; repli sur un seul processus
+    # si la vidéo est trop courte pour en profiter.
+    if parallele:
+        a_couper = intervalle is not None and not intervalle.deja_coupe
+        if enc.encoder_parallele(ffmpeg, str(src), str(cible), FILTRE_COMPRESSE, ARGS_VIDEO_COMPRESSEE,
+                                 ARGS_AUDIO_COMPRESSEE + ["-movflags", "+faststart"],
+                                 debut=intervalle.debut if a_couper else None,
+                                 fin=intervalle.fin if a_couper else None, rappel=afficher_progression):
+            return
+    _run_ffmpeg([ffmpeg, "-y"] + args_coupe(intervalle) + ["-i", str(src),
+                 "-vf", FILTRE_COMPRESSE] + ARGS_VIDEO_COMPRESSEE + ARGS_AUDIO_COMPRESSEE +
+                ["-movflags", "+faststart", str(cible)], "compression", duree_a_traiter(intervalle))
+
 # ---------------- Téléchargement / préparation vidéo ----------------
 
-def telecharger_preparer_video(url: str, cookies_path: Path | None, verbose: bool, qualite: str,
-                               utiliser_intervalle: bool, debut: int, fin: int):
-    # Télécharge une vidéo via yt-dlp puis normalise en MP4 (HD ou compressée)
-    st.write("Téléchargement / préparation de la vidéo en cours...")
+# Durée de vie des infos yt-dlp mémorisées : les URL de flux signées expirent au bout de quelques heures
+TTL_INFOS_URL = 30 * 60
+TAILLE_CACHE_INFOS_URL = 32
+
+def options_ytdlp(cookies_path: Path | None, verbose: bool) -> dict:
+    # Options yt-dlp communes à l’extraction des infos et au téléchargement
     user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:115.0) Gecko/20100101 Firefox/115.0"
     http_headers = {'User-Agent': user_agent, 'Accept': '*/*', 'Accept-Language': 'en-US,en;q=0.5', 'Referer': 'https://www.youtube.com/'}
 
@@ -200,17 +335,39 @@ def telecharger_preparer_video(url: str, cookies_path: Path | None, verbose: boo
             def error(self, msg): pass
         base_opts['logger'] = _SilentLogger()
 
-    if utiliser_intervalle:
-        base_opts['download_sections'] = [{'section': f"*{debut}-{fin}"}]
-        base_opts['force_keyframes_at_cuts'] = True
-
     if cookies_path:
         base_opts['cookiefile'] = str(cookies_path)
+    return base_opts
+
+@cache.memoiser(TAILLE_CACHE_INFOS_URL, TTL_INFOS_URL, copier=True)
+def infos_url(url: str, cookies: str | None, date_cookies: int | None, verbose: bool) -> dict:
+    # Infos yt-dlp brutes (avant choix du format) d’une URL, mémorisées par URL et état des cookies ;
+    # copie rendue à chaque appel car yt-dlp complète le dictionnaire en le traitant
+    from yt_dlp import YoutubeDL  # import différé : yt-dlp n’est chargé que pour une URL
+    with YoutubeDL(options_ytdlp(Path(cookies) if cookies else None, verbose)) as ydl:
+        return ydl.extract_info(url, download=False, process=False)
+
+def telecharger_preparer_video(url: str, cookies_path: Path | None, verbose: bool, qualite: str,
+                               intervalle: Intervalle | None, parallele: bool = False,
+                               protection: stk.Protection | None = None):
+    # Télécharge une vidéo via yt-dlp puis normalise en MP4 (HD ou compressée).
+    # Renvoie (chemin, base_court, info, intervalle, erreur) ; l’intervalle renvoyé indique
+    # si la coupe a déjà été faite par yt-dlp. protection couvre le fichier téléchargé dès le
+    # début (yt-dlp lui donne la date du serveur) jusqu’à la fin de l’encodage.
+    from yt_dlp import YoutubeDL
+    from yt_dlp.utils import DownloadError
+
+    st.write("Téléchargement / préparation de la vidéo en cours...")
+    base_opts = options_ytdlp(cookies_path, verbose)
+    if intervalle and not intervalle.deja_coupe:
+        base_opts['download_sections'] = [{'section': f"*{intervalle.debut}-{intervalle.fin}"}]
+        base_opts['force_keyframes_at_cuts'] = True
 
     formats_fallbacks = [
         "bv*[ext=mp4][height<=2160]+ba[ext=m4a]/b[ext=mp4]/b",
         "bv*+ba/b"
     ]
+    cle_infos = (url, str(cookies_path) if cookies_path else None, date_modification(cookies_path), verbose)
 
     derniere_erreur = None
     info = None
@@ -220,8 +377,12 @@ def telecharger_preparer_video(url: str, cookies_path: Path | None, verbose: boo
         ydl_opts = base_opts.copy()
         ydl_opts['format'] = fmt
         try:
+            # Extraction mémorisée : seul le choix du format et le téléchargement sont refaits
+            info_brute = infos_url(*cle_infos)
+            if protection is not None:
+                protection.ajouter(REPERTOIRE_SORTIE / f"{info_brute.get('id') or '*'}.*")
             with YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
+                info = ydl.process_ie_result(info_brute, download=True)
                 _ = ydl.prepare_filename(info)
             candidats = []
             for ext in ['mp4', 'mkv', 'webm', 'm4a', 'mp3']:
@@ -235,17 +396,24 @@ def telecharger_preparer_video(url: str, cookies_path: Path | None, verbose: boo
             msg = str(e) or repr(e)
             derniere_erreur = e
             if "403" in msg or "Forbidden" in msg:
+                infos_url.invalider(*cle_infos)
                 if not cookies_path:
-                    return None, None, None, "HTTP 403 détecté. La vidéo est restreinte. Fournis un fichier cookies.txt (Firefox : cookies.txt) puis relance."
-                return None, None, None, "HTTP 403 persistant malgré cookies. Vérifie que le cookies.txt est valide et récent."
+                    return None, None, None, None, "HTTP 403 détecté. La vidéo est restreinte. Fournis un fichier cookies.txt (Firefox : cookies.txt) puis relance."
+                return None, None, None, None, "HTTP 403 persistant malgré cookies. Vérifie que le cookies.txt est valide et récent."
             continue
 
     if fichier_final is None:
-        return None, None, None, (str(derniere_erreur) if derniere_erreur else "Echec inconnu au téléchargement.")
+        # Les URL de flux mémorisées ont peut-être expiré : la prochaine tentative ré-extrait
+        infos_url.invalider(*cle_infos)
+        return None, None, None, None, (str(derniere_erreur) if derniere_erreur else "Echec inconnu au téléchargement.")
+    if intervalle and not intervalle.deja_coupe:
+        intervalle = intervalle.coupe("telechargement")
 
     video_id = (info.get('id') if info else "vid") or "vid"
     titre_brut = (info.get('title') if info else fichier_final.stem) or "video"
     base_court = generer_nom_base(video_id, titre_brut)
+    if protection is not None:
+        protection.ajouter(fichier_final, REPERTOIRE_SORTIE / f"*{base_court}*")
 
     ext_src = fichier_final.suffix
     src_base = REPERTOIRE_SORTIE / f"{base_court}_src"
@@ -254,39 +422,21 @@ def telecharger_preparer_video(url: str, cookies_path: Path | None, verbose: boo
     cible = REPERTOIRE_SORTIE / f"{base_court}_video.mp4"
 
     try:
-        ffmpeg = tl.chemin_ffmpeg()
+        ffmpeg = bn.chemin_ffmpeg()
     except Exception as e:
-        return None, None, None, f"ffmpeg introuvable : {e}"
+        return None, None, None, None, f"ffmpeg introuvable : {e}"
 
-    def _run_ffmpeg(args):
-        subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-
-    if qualite == "Compressée (1280p, CRF 28)":
+    liberer_cible(cible)
+    if qualite == QUALITE_COMPRESSEE:
         try:
-            if utiliser_intervalle:
-                _run_ffmpeg([ffmpeg, "-y", "-ss", str(debut), "-to", str(fin), "-i", str(chemin_source_propre),
-                             "-vf", "scale=1280:-2", "-c:v", "libx264", "-preset", "slow", "-crf", "28",
-                             "-c:a", "aac", "-b:a", "96k", "-movflags", "+faststart", str(cible)])
-            else:
-                _run_ffmpeg([ffmpeg, "-y", "-i", str(chemin_source_propre),
-                             "-vf", "scale=1280:-2", "-c:v", "libx264", "-preset", "slow", "-crf", "28",
-                             "-c:a", "aac", "-b:a", "96k", "-movflags", "+faststart", str(cible)])
+            encoder_compresse(ffmpeg, str(chemin_source_propre), cible, intervalle, parallele)
         except Exception as e:
-            return None, None, None, f"Echec de la compression : {e}"
+            return None, None, None, None, f"Echec de la compression : {e}"
     else:
         try:
-            if utiliser_intervalle:
-                _run_ffmpeg([ffmpeg, "-y", "-ss", str(debut), "-to", str(fin), "-i", str(chemin_source_propre),
-                             "-c", "copy", "-movflags", "+faststart", str(cible)])
-            else:
-                _run_ffmpeg([ffmpeg, "-y", "-i", str(chemin_source_propre), "-c", "copy", "-movflags", "+faststart", str(cible)])
-        except Exception:
-            try:
-                _run_ffmpeg([ffmpeg, "-y", "-i", str(chemin_source_propre),
-                             "-c:v", "libx264", "-preset", "veryfast", "-crf", "18",
-                             "-c:a", "aac", "-b:a", "192k", "-movflags", "+faststart", str(cible)])
-            except Exception as e:
-                return None, None, None, f"Echec du remux/transcodage : {e}"
+            encoder_hd(ffmpeg, str(chemin_source_propre), cible, intervalle)
+        except Exception as e:
+            return None, None, None, None, f"Echec de la préparation HD : {e}"
 
     try:
         if chemin_source_propre.exists():
@@ -294,129 +444,241 @@ def telecharger_preparer_video(url: str, cookies_path: Path | None, verbose: boo
     except Exception:
         pass
 
-    return str(cible), base_court, info, None
+    enregistrer_sorties(base_court, [cible], "base", intervalle)
+    return str(cible), base_court, info, intervalle, None
 
 # ---------------- Traitement local ----------------
 
-def traiter_local(src_local: Path, base_court: str, qualite: str, utiliser_intervalle: bool, debut: int, fin: int) -> str:
-    # Prépare la vidéo de base depuis un fichier local (HD ou compressée)
+def traiter_local(src_local: Path, base_court: str, qualite: str, intervalle: Intervalle | None,
+                  parallele: bool = False):
+    # Prépare la vidéo de base depuis un fichier local (HD ou compressée).
+    # Renvoie (chemin, intervalle) ; la coupe éventuelle est faite ici, une seule fois.
     try:
-        ffmpeg = tl.chemin_ffmpeg()
+        ffmpeg = bn.chemin_ffmpeg()
     except Exception as e:
         raise RuntimeError(f"ffmpeg introuvable : {e}")
 
     cible = REPERTOIRE_SORTIE / f"{base_court}_video.mp4"
-    def _run_ffmpeg(args):
-        subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-
-    if qualite == "Compressée (1280p, CRF 28)":
-        args = [ffmpeg, "-y"]
-        if utiliser_intervalle:
-            args += ["-ss", str(debut), "-to", str(fin)]
-        args += ["-i", str(src_local), "-vf", "scale=1280:-2", "-c:v", "libx264", "-preset", "slow", "-crf", "28",
-                 "-c:a", "aac", "-b:a", "96k", "-movflags", "+faststart", str(cible)]
-        _run_ffmpeg(args)
+    liberer_cible(cible)
+    if qualite == QUALITE_COMPRESSEE:
+        encoder_compresse(ffmpeg, str(src_local), cible, intervalle, parallele)
+    elif intervalle and not intervalle.deja_coupe and \
+            enc.decoupe_intelligente(ffmpeg, str(src_local), intervalle.debut, intervalle.fin, str(cible),
+                                     afficher_progression):
+        # HD + intervalle : découpe intelligente réussie (cœur copié, bords ré-encodés)
+        st.write("Découpe à l’image près : seuls les GOP partiels aux bords ont été ré-encodés.")
     else:
-        try:
-            args = [ffmpeg, "-y"]
-            if utiliser_intervalle:
-                args += ["-ss", str(debut), "-to", str(fin)]
-            args += ["-i", str(src_local), "-c", "copy", "-movflags", "+faststart", str(cible)]
-            _run_ffmpeg(args)
-        except Exception:
-            args = [ffmpeg, "-y"]
-            if utiliser_intervalle:
-                args += ["-ss", str(debut), "-to", str(fin)]
-            args += ["-i", str(src_local), "-c:v", "libx264", "-preset", "veryfast", "-crf", "18",
-                     "-c:a", "aac", "-b:a", "192k", "-movflags", "+faststart", str(cible)]
-            _run_ffmpeg(args)
-    return str(cible)
+        encoder_hd(ffmpeg, str(src_local), cible, intervalle)
+    if intervalle and not intervalle.deja_coupe:
+        intervalle = intervalle.coupe("preparation")
+    enregistrer_sorties(base_court, [cible], "base", intervalle)
+    return str(cible), intervalle
 
 # ---------------- Extraction des ressources ----------------
 
-def extraire_ressources(video_path: str, debut: int, fin: int, base_court: str, options: dict, utiliser_intervalle: bool):
-    # Génère MP4/MP3/WAV/Images (1fps et/ou 25fps) avec nommage temporel
+def a_piste_audio(video_path: str) -> bool:
+    # Indique si la vidéo contient au moins une piste audio (fiche ffprobe, ou en-tête ffmpeg -i
+    # sans ffprobe) ; une source illisible lève une erreur au lieu de passer pour muette
+    return md.a_audio(str(video_path))
+
+def _scinder(entree: str, filtre: str, etiquettes: list) -> str:
+    # Duplique un flux du graphe vers N étiquettes (split/asplit, ou null/anull si une seule branche)
+    if len(etiquettes) == 1:
+        return f"{entree}{'anull' if filtre == 'asplit' else 'null'}[{etiquettes[0]}]"
+    return f"{entree}{filtre}={len(etiquettes)}" + "".join(f"[{e}]" for e in etiquettes)
+
+def _graphe_images(entree: str, reps_images: dict, decalage: int):
+    # Filtres et sorties produisant les images directement sous leur nom final, à partir du PTS réel
+    # (décalé dans le repère de la source) : i_<s>s_1fps.jpg et i_<s>s_25fps_<n>.jpg.
+    # Le flux 25 fps est réparti en 25 branches (n = rang de l’image dans sa seconde) dont le PTS est
+    # ramené à la seconde entière ; le flux 1 fps est dérivé du flux 25 fps. Renvoie (filtres, sorties).
+    recalage = f"setpts=PTS+{decalage}/TB," if decalage else ""
+    filtres, sorties = [], []
+    if 25 not in reps_images:
+        filtres.append(f"{entree}{recalage}fps=1,{FILTRE_IMAGES},settb=1[img1]")
+        sorties.append(["-map", "[img1]"] + ARGS_IMAGES + [str(reps_images[1] / "i_%ds_1fps.jpg")])
+        return filtres, sorties
+
+    branches = [f"img25_{n:02d}" for n in range(25)] + (["v_img1"] if 1 in reps_images else [])
+    filtres.append(f"{entree}{recalage}fps=25,{FILTRE_IMAGES},split={len(branches)}" + "".join(f"[{b}]" for b in branches))
+    for n in range(25):
+        filtres.append(f"[img25_{n:02d}]select='eq(mod(round(t*25),25),{n})',setpts=floor(T)/TB,settb=1[img25_{n:02d}_out]")
+        sorties.append(["-map", f"[img25_{n:02d}_out]"] + ARGS_IMAGES + [str(reps_images[25] / f"i_%ds_25fps_{n:02d}.jpg")])
+    if 1 in reps_images:
+        filtres.append("[v_img1]fps=1,settb=1[img1]")
+        sorties.append(["-map", "[img1]"] + ARGS_IMAGES + [str(reps_images[1] / "i_%ds_1fps.jpg")])
+    return filtres, sorties
+
+def _commande_graphe(ffmpeg: str, video_path: str, base_court: str, suffixe: str, options: dict,
+                     intervalle: Intervalle | None, avec_audio: bool, reps_images: dict):
+    # Commande ffmpeg unique : un décodage, un graphe split/asplit vers toutes les sorties
+    # (les images 1 fps sont dérivées du flux 25 fps). None si aucune sortie.
+    branches_video = []
+    if options.get("mp4"):
+        branches_video.append("v_mp4")
+    if reps_images:
+        branches_video.append("v_img")
+    branches_audio = [f"a_{cle}" for cle in ("mp4", "mp3", "wav") if options.get(cle)] if avec_audio else []
+
+    filtres = []
+    if branches_video:
+        filtres.append(_scinder("[0:v]", "split", branches_video))
+    if branches_audio:
+        filtres.append(_scinder("[0:a]", "asplit", branches_audio))
+
+    sorties = []
+    if options.get("mp4"):
+        filtres.append(f"[v_mp4]{FILTRE_COMPRESSE}[v_mp4_out]")
+        sortie = ["-map", "[v_mp4_out]"]
+        if avec_audio:
+            sortie += ["-map", "[a_mp4]"] + ARGS_AUDIO_COMPRESSEE
+        sortie += ARGS_VIDEO_COMPRESSEE + ["-movflags", "+faststart",
+                                           str(REPERTOIRE_SORTIE / f"{base_court}_{suffixe}.mp4")]
+        sorties.append(sortie)
+
+    if avec_audio and options.get("mp3"):
+        sorties.append(["-map", "[a_mp3]"] + ARGS_MP3 + [str(REPERTOIRE_SORTIE / f"{base_court}_{suffixe}.mp3")])
+
+    if avec_audio and options.get("wav"):
+        sorties.append(["-map", "[a_wav]"] + ARGS_WAV + [str(REPERTOIRE_SORTIE / f"{base_court}_{suffixe}.wav")])
+
+    if reps_images:
+        filtres_img, sorties_img = _graphe_images("[v_img]", reps_images, intervalle.debut if intervalle else 0)
+        filtres += filtres_img
+        sorties += sorties_img
+
+    if not sorties:
+        return None
+    args = [ffmpeg, "-y"] + args_coupe(intervalle)
+    args += ["-i", video_path, "-filter_complex", ";".join(filtres)]
+    for sortie in sorties:
+        args += sortie
+    return args
+
+def _commandes_independantes(ffmpeg: str, video_path: str, base_court: str, suffixe: str, options: dict,
+                             intervalle: Intervalle | None, avec_audio: bool, reps_images: dict):
+    # Une commande ffmpeg par sortie, exécutables simultanément (chacune décode la source).
+    # Renvoie (commandes, noms d’étape).
+    entree = [ffmpeg, "-y"] + args_coupe(intervalle) + ["-i", video_path]
+    commandes, etapes = [], []
+    if options.get("mp4"):
+        audio = ARGS_AUDIO_COMPRESSEE if avec_audio else ["-an"]
+        commandes.append(entree + ["-vf", FILTRE_COMPRESSE] + ARGS_VIDEO_COMPRESSEE + audio +
+                         ["-movflags", "+faststart", str(REPERTOIRE_SORTIE / f"{base_court}_{suffixe}.mp4")])
+        etapes.append("MP4")
+    if avec_audio and options.get("mp3"):
+        commandes.append(entree + ["-vn"] + ARGS_MP3 + [str(REPERTOIRE_SORTIE / f"{base_court}_{suffixe}.mp3")])
+        etapes.append("MP3")
+    if avec_audio and options.get("wav"):
+        commandes.append(entree + ["-vn"] + ARGS_WAV + [str(REPERTOIRE_SORTIE / f"{base_court}_{suffixe}.wav")])
+        etapes.append("WAV")
+    for fps, rep in sorted(reps_images.items()):
+        filtres_img, sorties_img = _graphe_images("[0:v]", {fps: rep}, intervalle.debut if intervalle else 0)
+        commandes.append(entree + ["-filter_complex", ";".join(filtres_img)] + [a for s in sorties_img for a in s])
+        etapes.append(f"images {fps} fps")
+    return commandes, etapes
+
+def extraire_ressources(video_path: str, base_court: str, options: dict, intervalle: Intervalle | None,
+                        profil_base: dict | None = None, parallele: bool = False, graphe_unique: bool = True):
+    # Génère MP4/MP3/WAV/Images (1fps et/ou 25fps) en un seul décodage :
+    # un graphe ffmpeg unique (split/asplit) alimente toutes les sorties cochées,
+    # les images 1 fps étant dérivées du flux 25 fps.
+    # Si la vidéo de base a déjà été encodée avec PROFIL_COMPRESSE, la sortie MP4 la réutilise
+    # (lien physique, ou copie de flux pour un intervalle pas encore coupé) au lieu d’un second
+    # passage x264. Un intervalle déjà coupé en amont n’est ni recherché ni redécoupé ici.
+    # En mode parallèle, la sortie MP4 est encodée à part par morceaux simultanés.
+    # Sans graphe unique, chaque sortie a sa propre commande et toutes tournent en même temps
+    # dans la limite du budget de cœurs (encodage.budget_coeurs).
     try:
-        ffmpeg = tl.chemin_ffmpeg()
+        ffmpeg = bn.chemin_ffmpeg()
     except Exception as e:
         return f"ffmpeg introuvable : {e}"
 
-    def _run_ffmpeg(args):
-        subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-
-    def cmd_segment(sortie: Path):
-        if utiliser_intervalle:
-            return [ffmpeg, "-y", "-ss", str(debut), "-to", str(fin), "-i", video_path,
-                    "-vf", "scale=1280:-2", "-c:v", "libx264", "-preset", "slow", "-crf", "28",
-                    "-c:a", "aac", "-b:a", "96k", "-movflags", "+faststart", str(sortie)]
-        else:
-            return [ffmpeg, "-y", "-i", video_path,
-                    "-vf", "scale=1280:-2", "-c:v", "libx264", "-preset", "slow", "-crf", "28",
-                    "-c:a", "aac", "-b:a", "96k", "-movflags", "+faststart", str(sortie)]
-
-    def cmd_audio(sortie: Path, codec_args):
-        if utiliser_intervalle:
-            return [ffmpeg, "-y", "-ss", str(debut), "-to", str(fin), "-i", video_path] + codec_args + ["-movflags", "+faststart", str(sortie)]
+    suffixe = "seg" if intervalle else "full"
+    avec_audio = a_piste_audio(video_path)
+    fps_images = [fps for fps in (1, 25) if options.get(f"img{fps}")]
+
+    options = dict(options)
+    # Capacités sondées une fois par binaire (gardées TTL_CAPACITES, voir binaires.py) : un MP3 impossible est écarté sans lancer ffmpeg
+    sans_mp3 = options.get("mp3") and not bn.encodeur_disponible("libmp3lame")
+    if sans_mp3:
+        options["mp3"] = False
+    formats = [ext for ext in ("mp4", "mp3", "wav") if options.get(ext)]
+    if options.get("mp4") and profil_base == PROFIL_COMPRESSE:
+        sortie_mp4 = REPERTOIRE_SORTIE / f"{base_court}_{suffixe}.mp4"
+        if args_coupe(intervalle):
+            liberer_cible(sortie_mp4)
+            _run_ffmpeg([ffmpeg, "-y"] + args_coupe(intervalle) + ["-i", video_path,
+                         "-c", "copy", "-movflags", "+faststart", str(sortie_mp4)],
+                        "MP4 (copie)", duree_a_traiter(intervalle))
         else:
-            return [ffmpeg, "-y", "-i", video_path] + codec_args + ["-movflags", "+faststart", str(sortie)]
-
-    def cmd_images(output_pattern: str, fps: int):
-        vf = f"fps={fps},scale=1920:1080"
-        if utiliser_intervalle:
-            return [ffmpeg, "-y", "-ss", str(debut), "-to", str(fin), "-i", video_path, "-vf", vf, "-q:v", "1", output_pattern]
-        else:
-            return [ffmpeg, "-y", "-i", video_path, "-vf", vf, "-q:v", "1", output_pattern]
+            lier_ou_copier(Path(video_path), sortie_mp4)
+        options["mp4"] = False
+    elif options.get("mp4") and parallele:
+        sortie_mp4 = REPERTOIRE_SORTIE / f"{base_court}_{suffixe}.mp4"
+        a_couper = intervalle is not None and not intervalle.deja_coupe
+        if enc.encoder_parallele(ffmpeg, video_path, str(sortie_mp4), FILTRE_COMPRESSE, ARGS_VIDEO_COMPRESSEE,
+                                 ARGS_AUDIO_COMPRESSEE + ["-movflags", "+faststart"],
+                                 debut=intervalle.debut if a_couper else None,
+                                 fin=intervalle.fin if a_couper else None, rappel=afficher_progression):
+            options["mp4"] = False
+
+    reps_images = {}
+    for fps in fps_images:
+        dossier = f"img{fps}_{base_court}" if intervalle else f"img{fps}_full_{base_court}"
+        rep = REPERTOIRE_SORTIE / dossier
+        # Les images d’une extraction précédente dans ce dossier (autre intervalle) ne doivent pas se
+        # mélanger aux nouvelles ; celles de la vidéo entière (autre dossier) restent en place
+        mf.retirer(REPERTOIRE_SORTIE, base_court, f"images {fps} fps", dossier=rep)
+        rep.mkdir(parents=True, exist_ok=True)
+        reps_images[fps] = rep
+
+    if graphe_unique:
+        commande = _commande_graphe(ffmpeg, video_path, base_court, suffixe, options, intervalle, avec_audio, reps_images)
+        if commande:
+            _run_ffmpeg(commande, "extraction (décodage unique)", duree_a_traiter(intervalle))
+    else:
+        commandes, etapes = _commandes_independantes(ffmpeg, video_path, base_court, suffixe, options, intervalle,
+                                                     avec_audio, reps_images)
+        if commandes:
+            enc.executer_en_parallele(commandes, etapes=etapes, durees=[duree_a_traiter(intervalle)] * len(commandes),
+                                      rappel=afficher_progression)
+
+    for ext in formats:
+        enregistrer_sorties(base_court, [REPERTOIRE_SORTIE / f"{base_court}_{suffixe}.{ext}"], ext.upper(), intervalle)
+    for fps, rep in reps_images.items():
+        mf.enregistrer_dossier(REPERTOIRE_SORTIE, base_court, rep, "i_*.jpg", f"images {fps} fps",
+                               intervalle.debut if intervalle else None, intervalle.fin if intervalle else None)
+
+    if not avec_audio and (options.get("mp3") or options.get("wav")):
+        return "aucune piste audio dans la vidéo : MP3/WAV non générés."
+    if sans_mp3:
+        return "encodeur libmp3lame absent de ce ffmpeg : MP3 non généré."
+    return None
 
-    if options.get("mp4"):
-        nom = f"{base_court}_seg.mp4" if utiliser_intervalle else f"{base_court}_full.mp4"
-        _run_ffmpeg(cmd_segment(REPERTOIRE_SORTIE / nom))
-
-    if options.get("mp3"):
-        nom = f"{base_court}_seg.mp3" if utiliser_intervalle else f"{base_court}_full.mp3"
-        _run_ffmpeg(cmd_audio(REPERTOIRE_SORTIE / nom, ["-vn", "-acodec", "libmp3lame", "-q:a", "5"]))
-
-    if options.get("wav"):
-        nom = f"{base_court}_seg.wav" if utiliser_intervalle else f"{base_court}_full.wav"
-        _run_ffmpeg(cmd_audio(REPERTOIRE_SORTIE / nom, ["-vn", "-acodec", "adpcm_ima_wav"]))
-
-    if options.get("img1") or options.get("img25"):
-        for fps in [1, 25]:
-            if (fps == 1 and options.get("img1")) or (fps == 25 and options.get("img25")):
-                dossier = f"img{fps}_{base_court}" if utiliser_intervalle else f"img{fps}_full_{base_court}"
-                rep = REPERTOIRE_SORTIE / dossier
-                rep.mkdir(parents=True, exist_ok=True)
-                tmp_pattern = str(rep / "tmp_%06d.jpg")
-                _run_ffmpeg(cmd_images(tmp_pattern, fps))
-                images_gen = sorted(rep.glob("tmp_*.jpg"))
-                start_offset = debut if utiliser_intervalle else 0
-                for i, src in enumerate(images_gen):
-                    t = start_offset + (i / float(fps))
-                    sec = int(t)
-                    if fps == 1:
-                        nom_cible = f"i_{sec}s_1fps.jpg"
-                    else:
-                        f_in_s = int(round((t - sec) * fps))
-                        if f_in_s >= fps:
-                            f_in_s = fps - 1
-                        nom_cible = f"i_{sec}s_{fps}fps_{f_in_s:02d}.jpg"
-                    dst = rep / nom_cible
-                    j = 1
-                    base_dst = dst.with_suffix("")
-                    ext = dst.suffix
-                    while dst.exists():
-                        dst = Path(f"{base_dst}_{j}{ext}")
-                        j += 1
-                    os.replace(str(src), str(dst))
+# ---------------- Aperçu ----------------
 
-    return None
+def afficher_apercu_video(chemin: str):
+    # Affiche le proxy 360p du début de la vidéo (produit une seule fois par source, servi depuis le disque)
+    try:
+        with st.spinner("Préparation de l’aperçu..."):
+            proxy = enc.proxy_apercu(bn.chemin_ffmpeg(), chemin, REPERTOIRE_APERCUS)
+        stk.toucher(proxy)
+        st.video(str(proxy), format="video/mp4")
+    except Exception as e:
+        st.info(f"Aperçu indisponible : {e}")
+        return
+    try:
+        if (md.duree(chemin) or 0) > enc.DUREE_MAX_APERCU:
+            st.caption(f"Aperçu limité aux {enc.DUREE_MAX_APERCU} premières secondes.")
+    except Exception:
+        pass  # durée inconnue (ffprobe absent) : pas de mention
 
 # ---------------- Interface utilisateur ----------------
 
 st.title("Extraction multimédia (vidéo, audio, images)")
 st.markdown("**[www.codeandcortex.fr](http://www.codeandcortex.fr)**")
 
-vider_cache()
-
 st.markdown(
     "Par défaut, l’extraction porte sur **toute la vidéo**. Vous pouvez activer un intervalle personnalisé si besoin. "
     "Si la vidéo est restreinte (403), exportez vos cookies avec l’extension Firefox : "
@@ -425,26 +687,44 @@ st.markdown(
 
 with st.expander("Diagnostic système"):
     try:
-        chemin = tl.chemin_ffmpeg()
-        ver = subprocess.run([chemin, "-version"], capture_output=True, text=True, check=False)
-        st.write(f"ffmpeg : {chemin}")
-        if ver.stdout:
-            st.code(ver.stdout.splitlines()[0])
+        cap = bn.capacites()
+        st.write(f"ffmpeg : {cap.chemin}")
+        if cap.version:
+            st.code(cap.version)
+        st.write("Encodeurs : " + ", ".join(f"{nom} {'✓' if cap.a_encodeur(nom) else '✗'}"
+                                            for nom in ("libx264", "libmp3lame", "aac", "mjpeg")))
+        st.write(f"Filtres : {len(cap.filtres)} — cœurs : {cap.coeurs} (budget {enc.budget_coeurs()})")
     except Exception as e:
         st.write(f"ffmpeg : introuvable ({e})")
     try:
         st.write(ck.info_cookies(REPERTOIRE_SORTIE))
     except Exception:
         pass
+    try:
+        # Inventaire du dernier nettoyage : aucun parcours des zones au rendu
+        u = stk.utilisation()
+        if u is None:
+            st.write("Stockage : inconnu (premier nettoyage en cours)")
+        else:
+            st.write(f"Stockage : {u.octets / 1e6:.0f} Mo sur {u.quota / 1e6:.0f} Mo ({u.nb} éléments) — "
+                     + ", ".join(f"{zone} {octets / 1e6:.0f} Mo" for zone, octets in u.par_zone.items())
+                     + f" (mesuré il y a {(time.time() - u.mesure) / 60:.0f} min)")
+        if u is not None and u.plus_ancien is not None:
+            st.write(f"Accès le plus ancien : il y a {(time.time() - u.plus_ancien) / 3600:.1f} h "
+                     f"(éviction au-delà de {u.age_max / 3600:.0f} h)")
+    except Exception:
+        pass
 
 # Etats init
 st.session_state.setdefault("debut_secs", 0)
 st.session_state.setdefault("fin_secs", 10)
 st.session_state.setdefault("video_base", None)
 st.session_state.setdefault("base_court", None)
-st.session_state.setdefault("apercu_local_bytes", None)
+st.session_state.setdefault("profil_base", None)
+st.session_state.setdefault("intervalle_base", None)
 st.session_state.setdefault("upload_signature", None)
 st.session_state.setdefault("local_temp_path", None)
+st.session_state.setdefault("local_empreinte", None)
 st.session_state.setdefault("local_name_base", None)
 
 # Source
@@ -452,9 +732,25 @@ url = st.text_input("URL YouTube")
 cookies_path_eff = ck.afficher_section_cookies(REPERTOIRE_SORTIE)
 fichier_local = st.file_uploader("Ou importer un fichier vidéo (.mp4)", type=["mp4"])
 
+# Ingestion de l’upload, une seule fois par fichier envoyé (et indépendamment de l’aperçu)
+if fichier_local is not None:
+    signature = getattr(fichier_local, "file_id", None) or f"{fichier_local.name}-{fichier_local.size}"
+    # Réingéré aussi si la copie sur disque a été évincée entre-temps (stockage.py)
+    if signature != st.session_state['upload_signature'] or not (
+            st.session_state['local_temp_path'] and Path(st.session_state['local_temp_path']).is_file()):
+        with st.spinner("Réception du fichier..."):
+            chemin_upload, empreinte_upload = ingerer_upload(fichier_local, REPERTOIRE_TEMP)
+        st.session_state['upload_signature'] = signature
+        st.session_state['local_temp_path'] = str(chemin_upload)
+        st.session_state['local_empreinte'] = empreinte_upload
+        st.session_state['local_name_base'] = generer_nom_base("local", Path(fichier_local.name).stem)
+
 # Options globales
 mode_verbose = st.checkbox("Mode diagnostic yt-dl", value=False)
-qualite = st.radio("Qualité de la vidéo de base", ["Compressée (1280p, CRF 28)", "HD (max qualité dispo)"], index=0)
+qualite = st.radio("Qualité de la vidéo de base", [QUALITE_COMPRESSEE, "HD (max qualité dispo)"], index=0)
+encodage_parallele = st.checkbox("Encodage parallèle multi-cœurs (vidéos longues)", value=True)
+moteur_extraction = st.radio("Moteur d’extraction", ["Décodage unique (graphe ffmpeg)", "Sorties indépendantes en parallèle"],
+                             index=0, horizontal=True)
 
 # Ressources à produire
 st.subheader("Ressources à produire")
@@ -467,8 +763,22 @@ opt_timelapse = st.checkbox("Timelapse", key="opt_timelapse")
 if opt_timelapse:
     st.warning("Timelapse sélectionné : seul le **timelapse** sera exporté. Les autres options sont désactivées.")
     fps_timelapse = st.selectbox("FPS timelapse", [4, 6, 8, 10, 12, 14, 16], index=2, key="fps_timelapse")
+    images_timelapse = st.checkbox("Conserver les images JPEG du timelapse (reprise possible, plus lent)",
+                                   value=False, key="images_timelapse")
+    adaptatif_timelapse = st.checkbox("Timelapse adaptatif (saute les passages statiques)", value=False,
+                                      key="adaptatif_timelapse")
+    if adaptatif_timelapse:
+        ca1, ca2 = st.columns(2)
+        seuil_mouvement = ca1.slider("Seuil de mouvement (écart moyen, 0-255)", 0.5, 10.0,
+                                     float(tl.SEUIL_MOUVEMENT_DEFAUT), 0.5, key="seuil_mouvement")
+        ecart_max = ca2.number_input("Écart maximal (images candidates)", min_value=1, max_value=1000,
+                                     value=tl.ECART_MAX_DEFAUT, key="ecart_max")
+    else:
+        seuil_mouvement, ecart_max = None, tl.ECART_MAX_DEFAUT
 else:
     fps_timelapse = 12
+    images_timelapse = False
+    seuil_mouvement, ecart_max = None, tl.ECART_MAX_DEFAUT
 
 # Cases des autres ressources, désactivées si timelapse
 c1, c2, c3, c4, c5 = st.columns([1,1,1,1,1])
@@ -492,48 +802,34 @@ if etendue == "Intervalle personnalisé":
 else:
     utiliser_intervalle = False
 
+# Intervalle demandé, en repère source ; chaque étape le marque lorsqu’elle a appliqué la coupe
+intervalle_demande = Intervalle(int(st.session_state["debut_secs"]), int(st.session_state["fin_secs"])) if utiliser_intervalle else None
+
 # Aperçu vidéo (désactivé si timelapse)
 afficher_apercu = st.checkbox("Afficher l’aperçu vidéo", value=True, disabled=opt_timelapse)
 if afficher_apercu and not opt_timelapse:
     if st.session_state.get('video_base') and Path(st.session_state['video_base']).exists():
-        size = taille_fichier(Path(st.session_state['video_base'])) or 0
-        if size <= SEUIL_APERCU_OCTETS:
-            with open(st.session_state['video_base'], "rb") as f:
-                st.video(f.read(), format="video/mp4")
-    elif fichier_local is not None:
-        signature = f"{fichier_local.name}-{fichier_local.size}"
-        if signature != st.session_state['upload_signature']:
-            tmp = REPERTOIRE_TEMP / f"local_upload_{signature}.mp4"
-            with open(tmp, "wb") as g:
-                g.write(fichier_local.read())
-            st.session_state['upload_signature'] = signature
-            st.session_state['apercu_local_bytes'] = None
-            try:
-                data = tmp.read_bytes()
-                st.session_state['apercu_local_bytes'] = data if len(data) <= SEUIL_APERCU_OCTETS else b""
-            except Exception:
-                st.session_state['apercu_local_bytes'] = b""
-            st.session_state['local_temp_path'] = str(tmp)
-            st.session_state['local_name_base'] = generer_nom_base("local", Path(fichier_local.name).stem)
-        if st.session_state.get('apercu_local_bytes'):
-            st.video(st.session_state['apercu_local_bytes'], format="video/mp4")
-        else:
-            st.info("Fichier local volumineux : aperçu désactivé (lance le traitement).")
+        afficher_apercu_video(st.session_state['video_base'])
+    elif fichier_local is not None and st.session_state.get('local_temp_path'):
+        afficher_apercu_video(st.session_state['local_temp_path'])
     elif url:
         st.info("Aperçu indisponible pour une URL tant que le traitement n’a pas été lancé.")
 
 # ---------------- Bouton d’exécution ----------------
 
 if st.button("Lancer le traitement"):
-    with st.spinner("Traitement en cours..."):
+    # Les artefacts du job (source, sorties, dossier timelapse) ne sont pas évincés pendant le traitement
+    with st.spinner("Traitement en cours..."), \
+            stk.en_cours(st.session_state.get('local_temp_path'), st.session_state.get('video_base')) as protection:
+        zone_progression = st.empty()
         if not ffmpeg_disponible():
             st.error("ffmpeg introuvable et fallback impossible (réseau bloqué ?). Ajoute 'imageio-ffmpeg' dans requirements.txt ou autorise le réseau.")
         else:
             # Préparation vidéo de base (URL ou fichier local)
             if url:
-                video_base, base_court, info, err = telecharger_preparer_video(
-                    url, cookies_path_eff, mode_verbose, qualite, utiliser_intervalle,
-                    st.session_state["debut_secs"], st.session_state["fin_secs"]
+                video_base, base_court, info, intervalle_base, err = telecharger_preparer_video(
+                    url, cookies_path_eff, mode_verbose, qualite, intervalle_demande, encodage_parallele,
+                    protection=protection
                 )
                 if err:
                     st.error(f"Erreur : {err}")
@@ -541,14 +837,19 @@ if st.button("Lancer le traitement"):
                 else:
                     st.session_state['video_base'] = video_base
                     st.session_state['base_court'] = base_court
+                    st.session_state['profil_base'] = PROFIL_COMPRESSE if qualite == QUALITE_COMPRESSEE else None
+                    st.session_state['intervalle_base'] = intervalle_base
                     st.success(f"Vidéo prête : {Path(video_base).name}")
             elif st.session_state.get('local_temp_path'):
                 base_court = st.session_state.get('local_name_base') or generer_nom_base("local", "video")
+                protection.ajouter(REPERTOIRE_SORTIE / f"*{base_court}*")
                 try:
-                    cible = traiter_local(Path(st.session_state['local_temp_path']), base_court, qualite, utiliser_intervalle,
-                                          st.session_state["debut_secs"], st.session_state["fin_secs"])
+                    cible, intervalle_base = traiter_local(Path(st.session_state['local_temp_path']), base_court, qualite,
+                                                           intervalle_demande, encodage_parallele)
                     st.session_state['video_base'] = cible
                     st.session_state['base_court'] = base_court
+                    st.session_state['profil_base'] = PROFIL_COMPRESSE if qualite == QUALITE_COMPRESSEE else None
+                    st.session_state['intervalle_base'] = intervalle_base
                     st.success(f"Vidéo prête : {Path(cible).name}")
                 except Exception as e:
                     st.error(f"Echec du traitement local : {e}")
@@ -559,36 +860,41 @@ if st.button("Lancer le traitement"):
             if st.session_state.get('video_base') and Path(st.session_state['video_base']).exists():
                 base_court = st.session_state['base_court']
                 video_path = st.session_state['video_base']
+                intervalle_base = st.session_state.get('intervalle_base')
+                protection.ajouter(video_path, REPERTOIRE_SORTIE / f"*{base_court}*")
+                stk.toucher(video_path)
 
                 if opt_timelapse:
                     # Exclusivité timelapse : on ne génère que le timelapse
                     try:
-                        intervalle = (st.session_state["debut_secs"], st.session_state["fin_secs"]) if utiliser_intervalle else None
-                        job_id = hash_job(f"file:{video_path}", st.session_state.get("fps_timelapse", 12), intervalle)
+                        intervalle = (intervalle_base.debut, intervalle_base.fin) if intervalle_base else None
+                        # Vidéo de base déjà coupée : le timelapse la parcourt entièrement
+                        a_couper = intervalle_base is not None and not intervalle_base.deja_coupe
+                        # Clé sur le contenu : <base>_video.mp4 réécrit sous le même nom change de job
+                        mouvement = (seuil_mouvement, int(ecart_max)) if seuil_mouvement is not None else None
+                        job_id = hash_job(f"contenu:{md.empreinte_contenu(video_path)}",
+                                          st.session_state.get("fps_timelapse", 12), intervalle, mouvement)
+                        protection.ajouter(tl.TIMELAPSE_DIR / f"job_{job_id}")
                         out_path, nb_images = tl.executer_timelapse(
                             video_path, job_id, base_court, st.session_state.get("fps_timelapse", 12),
-                            debut=st.session_state["debut_secs"] if utiliser_intervalle else None,
-                            fin=st.session_state["fin_secs"] if utiliser_intervalle else None
+                            debut=intervalle_base.debut if a_couper else None,
+                            fin=intervalle_base.fin if a_couper else None,
+                            rappel=afficher_progression, conserver_images=images_timelapse,
+                            segments=None if encodage_parallele else 1,
+                            seuil_mouvement=seuil_mouvement, ecart_max=int(ecart_max)
                         )
+                        enregistrer_sorties(base_court, [out_path], "timelapse", intervalle_base)
                         st.success(f"Timelapse généré ({nb_images} images).")
-                        with open(out_path, "rb") as fh:
-                            st.download_button("Télécharger le timelapse (.mp4)", data=fh, file_name=Path(out_path).name, mime="video/mp4")
-                        # Zip ne contient que le timelapse en mode exclusif
+                        bouton_telechargement("Télécharger le timelapse (.mp4)", out_path, "video/mp4")
+                        # Zip ne contient que le timelapse en mode exclusif (et ses images si conservées)
                         zip_path = REPERTOIRE_SORTIE / f"resultats_{base_court}_timelapse.zip"
-                        zipper_sur_disque([out_path], zip_path)
-                        with open(zip_path, "rb") as fhz:
-                            st.download_button("Télécharger les résultats (.zip)", data=fhz, file_name=zip_path.name, mime="application/zip")
+                        images = sorted(tl.dossier_images(job_id).glob("frame_*.jpg")) if images_timelapse else []
+                        zipper_sur_disque([out_path] + images, zip_path)
+                        bouton_telechargement("Télécharger les résultats (.zip)", zip_path, "application/zip")
                     except Exception as e:
                         st.error(f"Echec du timelapse : {e}")
                 else:
                     # Génération des ressources cochées
-                    if utiliser_intervalle:
-                        debut_eff = st.session_state["debut_secs"]
-                        fin_eff = st.session_state["fin_secs"]
-                    else:
-                        duree = duree_video_seconds(Path(video_path)) or 0
-                        debut_eff, fin_eff = 0, duree
-
                     options = {
                         "mp4": opt_mp4,
                         "mp3": opt_mp3,
@@ -597,7 +903,12 @@ if st.button("Lancer le traitement"):
                         "img25": opt_img25
                     }
                     if any(options.values()):
-                        err2 = extraire_ressources(video_path, debut_eff, fin_eff, base_court, options, utiliser_intervalle)
+                        try:
+                            err2 = extraire_ressources(video_path, base_court, options, intervalle_base,
+                                                       st.session_state.get('profil_base'), encodage_parallele,
+                                                       moteur_extraction.startswith("Décodage unique"))
+                        except Exception as e:
+                            err2 = str(e)
                         if err2:
                             st.error(f"Erreur pendant l'extraction : {err2}")
                         else:
@@ -609,5 +920,4 @@ if st.button("Lancer le traitement"):
                         fichiers.append(Path(video_path))
                     zip_path = REPERTOIRE_SORTIE / f"resultats_{base_court}.zip"
                     zipper_sur_disque(fichiers, zip_path)
-                    with open(zip_path, "rb") as fh:
-                        st.download_button("Télécharger les résultats (.zip)", data=fh, file_name=zip_path.name, mime="application/zip")
+                    bouton_telechargement("Télécharger les résultats (.zip)", zip_path, "application/zip")
@@ -0,0 +1,119 @@
+# manifeste.py
+# Index des sorties d’un job, tenu au fil de la production :
+# - un fichier <base>.manifeste.json par job dans le répertoire de sortie
+# - une entrée par fichier produit : chemin relatif, taille, étape, plage temporelle
+# - listage, zip et nettoyage lisent l’index (coût proportionnel aux sorties du job)
+#   au lieu de parcourir le répertoire partagé
+
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+VERSION = 1
+# Les étapes d’extraction peuvent enregistrer depuis plusieurs threads
+_verrou = threading.Lock()
+
+# ---------------- Lecture / écriture ----------------
+
+def chemin_manifeste(repertoire: Path, base: str) -> Path:
+    """
+    Retourne le chemin du manifeste du job base.
+    """
+    return Path(repertoire) / f"{base}.manifeste.json"
+
+def _charger(repertoire: Path, base: str) -> dict:
+    try:
+        d = json.loads(chemin_manifeste(repertoire, base).read_text(encoding="utf-8"))
+        if d.get("version") == VERSION:
+            return d
+    except (OSError, ValueError):
+        pass
+    return {"version": VERSION, "sorties": {}}
+
+def _sauver(repertoire: Path, base: str, d: dict) -> None:
+    p = chemin_manifeste(repertoire, base)
+    tmp = p.with_name(p.name + ".tmp")
+    tmp.write_text(json.dumps(d, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, p)
+
+def _relatif(repertoire: Path, chemin: Path) -> str:
+    try:
+        return Path(chemin).resolve().relative_to(Path(repertoire).resolve()).as_posix()
+    except ValueError:
+        return str(Path(chemin).resolve())
+
+def _absolu(repertoire: Path, rel: str) -> Path:
+    p = Path(rel)
+    return p if p.is_absolute() else Path(repertoire) / p
+
+# ---------------- API ----------------
+
+def enregistrer(repertoire: Path, base: str, fichiers: Iterable, etape: str,
+                debut: Optional[float] = None, fin: Optional[float] = None) -> int:
+    """
+    Ajoute (ou met à jour) les fichiers produits par une étape. Les fichiers absents sont ignorés.
+    Renvoie le nombre d’entrées enregistrées.
+    """
+    nouvelles = {}
+    maintenant = time.time()
+    for f in fichiers:
+        f = Path(f)
+        try:
+            taille = f.stat().st_size
+        except OSError:
+            continue
+        nouvelles[_relatif(repertoire, f)] = {"taille": taille, "etape": etape,
+                                               "debut": debut, "fin": fin, "cree": maintenant}
+    if nouvelles:
+        with _verrou:
+            d = _charger(repertoire, base)
+            d["sorties"].update(nouvelles)
+            _sauver(repertoire, base, d)
+    return len(nouvelles)
+
+def enregistrer_dossier(repertoire: Path, base: str, dossier: Path, motif: str, etape: str,
+                        debut: Optional[float] = None, fin: Optional[float] = None) -> int:
+    """
+    Enregistre les fichiers d’un dossier propre au job (ex. images) correspondant au motif.
+    Seul ce dossier est parcouru.
+    """
+    return enregistrer(repertoire, base, sorted(Path(dossier).glob(motif)), etape, debut, fin)
+
+def entrees(repertoire: Path, base: str) -> List[dict]:
+    """
+    Renvoie les entrées du manifeste (chemin absolu compris), les plus récentes en premier.
+    """
+    d = _charger(repertoire, base)
+    res = [dict(e, chemin=_absolu(repertoire, rel)) for rel, e in d["sorties"].items()]
+    res.sort(key=lambda e: e.get("cree") or 0, reverse=True)
+    return res
+
+def fichiers(repertoire: Path, base: str) -> List[Path]:
+    """
+    Renvoie les fichiers du job encore présents, les plus récents en premier.
+    """
+    return [e["chemin"] for e in entrees(repertoire, base) if e["chemin"].is_file()]
+
+def retirer(repertoire: Path, base: str, etape: str, dossier: Optional[Path] = None) -> int:
+    """
+    Supprime du disque et du manifeste les fichiers d’une étape (ex. avant de la refaire),
+    limités à ceux de dossier s’il est donné (les sorties de la même étape rangées ailleurs,
+    ex. images de la vidéo entière, sont gardées). Renvoie le nombre de fichiers retirés.
+    """
+    prefixe = _relatif(repertoire, dossier) + "/" if dossier is not None else ""
+    with _verrou:
+        d = _charger(repertoire, base)
+        a_retirer = [rel for rel, e in d["sorties"].items()
+                     if e.get("etape") == etape and rel.startswith(prefixe)]
+        for rel in a_retirer:
+            try:
+                _absolu(repertoire, rel).unlink()
+            except FileNotFoundError:
+                pass
+            del d["sorties"][rel]
+        if a_retirer:
+            _sauver(repertoire, base, d)
+    return len(a_retirer)
@@ -0,0 +1,219 @@
+# medias.py
+# Sondage des médias via ffprobe :
+# - fiche média (durée, cadence exacte, flux) obtenue par une seule requête ffprobe JSON sur
+#   l’en-tête, mémorisée par (chemin, taille, mtime) avec éviction LRU et TTL
+# - description des flux (codec, format de pixels, profil)
+# - index des images clés (paquets du premier flux vidéo seulement, sans décodage), lu à la
+#   demande par la découpe à l’image près, l’encodage par morceaux et le timelapse
+# - présence d’audio et codecs lus dans l’en-tête affiché par `ffmpeg -i` quand ffprobe est absent
+#   (ex. imageio-ffmpeg, livré sans ffprobe) ; un échec de lecture n’équivaut jamais à « muet »
+# - empreinte de contenu peu coûteuse (taille + blocs échantillonnés), mémorisée comme la fiche
+
+import re
+import json
+import hashlib
+import subprocess
+from dataclasses import dataclass
+from fractions import Fraction
+from pathlib import Path
+from typing import Optional, List, Tuple
+
+from binaires import chemin_ffmpeg, chemin_ffprobe
+from caches import memoiser
+
+# Nombre de fiches média gardées en mémoire, et durée de vie (s) d’une fiche
+TAILLE_CACHE = 32
+TTL_CACHE = 3600
+
+def _ffprobe_json(args: List[str]) -> dict:
+    r = subprocess.run([chemin_ffprobe(), "-v", "error", "-of", "json"] + args,
+                       capture_output=True, text=True, check=True)
+    return json.loads(r.stdout or "{}")
+
+# ---------------- Fiche média (mémorisée) ----------------
+
+@dataclass(frozen=True)
+class InfosMedia:
+    duree: Optional[float]                  # durée du conteneur (s)
+    fps: Optional[Fraction]                 # cadence moyenne exacte du premier flux vidéo
+    flux: Tuple[dict, ...]                  # description ffprobe de chaque flux
+
+    @property
+    def video(self) -> Optional[dict]:
+        return next((f for f in self.flux if f.get("codec_type") == "video"), None)
+
+    @property
+    def audio(self) -> Optional[dict]:
+        return next((f for f in self.flux if f.get("codec_type") == "audio"), None)
+
+def _cadence(flux: dict) -> Optional[Fraction]:
+    for cle in ("avg_frame_rate", "r_frame_rate"):
+        try:
+            f = Fraction(flux.get(cle) or "0/0")
+        except (ValueError, ZeroDivisionError):
+            continue
+        if f > 0:
+            return f
+    return None
+
+@memoiser(TAILLE_CACHE, TTL_CACHE)
+def _infos(chemin: str, taille: int, mtime_ns: int) -> InfosMedia:
+    # taille / mtime_ns ne servent qu’à la clé du cache : un fichier réécrit est ressondé
+    d = _ffprobe_json(["-show_entries", "format=duration:stream", chemin])
+    flux = tuple(d.get("streams") or [])
+    video = next((f for f in flux if f.get("codec_type") == "video"), None)
+    valeur = (d.get("format") or {}).get("duration")
+    return InfosMedia(duree=float(valeur) if valeur not in (None, "N/A") else None,
+                      fps=_cadence(video) if video else None, flux=flux)
+
+@memoiser(TAILLE_CACHE, TTL_CACHE)
+def _paquets(chemin: str, taille: int, mtime_ns: int) -> Tuple[Tuple[float, bool], ...]:
+    # Paquets du premier flux vidéo seulement : les autres flux gonfleraient la sortie JSON
+    d = _ffprobe_json(["-select_streams", "v:0", "-show_entries", "packet=pts_time,flags", chemin])
+    return tuple(sorted((float(p["pts_time"]), "K" in (p.get("flags") or ""))
+                        for p in d.get("packets") or [] if p.get("pts_time") not in (None, "N/A")))
+
+def _cle(chemin: str) -> Tuple[str, int, int]:
+    p = Path(chemin).resolve()
+    st = p.stat()
+    return str(p), st.st_size, st.st_mtime_ns
+
+def infos(chemin: str) -> InfosMedia:
+    """
+    Renvoie la fiche média de chemin (une requête ffprobe sur l’en-tête, sans lecture des
+    paquets). Le résultat est mémorisé tant que le fichier garde la même taille et la même
+    date de modification.
+    """
+    return _infos(*_cle(chemin))
+
+# ---------------- Repli sans ffprobe ----------------
+
+# « Stream #0:0[0x1](und): Video: h264 (High) (avc1 / 0x31637661), yuv420p(progressive), ... » :
+# type, codec, profil (première parenthèse, sauf étiquette « avc1 / 0x... »), format de pixels
+_RE_FLUX = re.compile(r"^\s*Stream #\d+:\d+\S*: (Video|Audio|Subtitle|Data): (\w+)"
+                      r"(?: \(([^)]*)\))?(?: \([^)]*\))*(?:, (\w+))?", re.MULTILINE)
+
+@memoiser(TAILLE_CACHE, TTL_CACHE)
+def _flux_ffmpeg(chemin: str, taille: int, mtime_ns: int) -> Tuple[dict, ...]:
+    r = subprocess.run([chemin_ffmpeg(), "-hide_banner", "-i", chemin], capture_output=True, text=True, check=False)
+    sortie = r.stderr or ""
+    if "Input #0" not in sortie:
+        raise RuntimeError(f"Lecture impossible de {Path(chemin).name} : "
+                           f"{(sortie.strip().splitlines() or ['ffmpeg muet'])[-1]}")
+    flux = []
+    for m in _RE_FLUX.finditer(sortie):
+        f = {"codec_type": m.group(1).lower(), "codec_name": m.group(2)}
+        if m.group(3) and "/" not in m.group(3):
+            f["profile"] = m.group(3)
+        if f["codec_type"] == "video" and m.group(4):
+            f["pix_fmt"] = m.group(4)
+        flux.append(f)
+    return tuple(flux)
+
+def flux_ffmpeg(chemin: str) -> Tuple[dict, ...]:
+    """
+    Description sommaire des flux (codec_type, codec_name, profile, pix_fmt pour la vidéo) lue
+    dans l’en-tête affiché par `ffmpeg -i`, quand ffprobe est absent. Lève RuntimeError si
+    ffmpeg ne peut lire le fichier.
+    """
+    return _flux_ffmpeg(*_cle(chemin))
+
+def a_audio(chemin: str) -> bool:
+    """
+    Indique si chemin contient un flux audio : fiche ffprobe, ou à défaut en-tête lu par
+    `ffmpeg -i`. Lève RuntimeError si ni l’un ni l’autre ne peut lire le fichier.
+    """
+    try:
+        return infos(chemin).audio is not None
+    except RuntimeError:
+        # ffprobe introuvable (résolution mémorisée par binaires.py)
+        return any(f["codec_type"] == "audio" for f in flux_ffmpeg(chemin))
+
+# ---------------- Empreinte de contenu ----------------
+
+# Blocs lus pour l’empreinte : début, fin et points régulièrement espacés entre les deux
+NB_BLOCS_EMPREINTE = 16
+TAILLE_BLOC_EMPREINTE = 64 * 1024
+
+@memoiser(TAILLE_CACHE, TTL_CACHE)
+def _empreinte(chemin: str, taille: int, mtime_ns: int) -> str:
+    h = hashlib.sha1(str(taille).encode("utf-8"))
+    with open(chemin, "rb") as f:
+        if taille <= NB_BLOCS_EMPREINTE * TAILLE_BLOC_EMPREINTE:
+            h.update(f.read())
+        else:
+            pas = (taille - TAILLE_BLOC_EMPREINTE) // (NB_BLOCS_EMPREINTE - 1)
+            for k in range(NB_BLOCS_EMPREINTE):
+                f.seek(k * pas)
+                h.update(f.read(TAILLE_BLOC_EMPREINTE))
+    return h.hexdigest()
+
+def empreinte_contenu(chemin: str) -> str:
+    """
+    Empreinte du contenu de chemin : taille et SHA-1 de NB_BLOCS_EMPREINTE blocs répartis dans
+    le fichier (au plus 1 Mio lu). Change quand le fichier est réécrit sous le même nom ;
+    mémorisée tant que taille et date de modification ne changent pas.
+    """
+    return _empreinte(*_cle(chemin))
+
+# ---------------- Flux / images clés ----------------
+
+def flux_video(chemin: str) -> Optional[dict]:
+    """
+    Renvoie la description ffprobe du premier flux vidéo (codec_name, pix_fmt, profile...), ou None.
+    """
+    return infos(chemin).video
+
+def rotation(flux: dict) -> int:
+    """
+    Rotation d’affichage (degrés, 0-359) d’un flux vidéo : matrice d’affichage, ou ancienne
+    balise rotate. ffmpeg et OpenCV l’appliquent par défaut au décodage.
+    """
+    for donnee in flux.get("side_data_list") or []:
+        if "rotation" in donnee:
+            try:
+                return int(round(float(donnee["rotation"]))) % 360
+            except (TypeError, ValueError):
+                pass
+    try:
+        return int((flux.get("tags") or {}).get("rotate") or 0) % 360
+    except ValueError:
+        return 0
+
+def flux_audio(chemin: str) -> Optional[dict]:
+    """
+    Renvoie la description ffprobe du premier flux audio, ou None si la vidéo est muette.
+    """
+    return infos(chemin).audio
+
+def duree(chemin: str) -> Optional[float]:
+    """
+    Renvoie la durée (s) du conteneur, ou None si ffprobe ne la connaît pas.
+    """
+    return infos(chemin).duree
+
+def paquets_video(chemin: str) -> List[Tuple[float, bool]]:
+    """
+    Renvoie (instant en s, image clé ?) pour chaque paquet du premier flux vidéo, en ordre de présentation.
+    Seuls les paquets sont lus (pas de décodage) : coût proche d’une lecture du fichier, mémorisé
+    comme la fiche.
+    """
+    return list(_paquets(*_cle(chemin)))
+
+def images_cles(chemin: str) -> List[float]:
+    """
+    Renvoie les instants (s) des images clés du premier flux vidéo, triés.
+    """
+    return [t for t, cle in _paquets(*_cle(chemin)) if cle]
+
+def nb_images(chemin: str) -> int:
+    """
+    Nombre d’images du premier flux vidéo : nb_frames de l’en-tête s’il est renseigné (MP4),
+    sinon nombre de paquets (WebM, MKV...).
+    """
+    video = infos(chemin).video or {}
+    try:
+        n = int(video.get("nb_frames") or 0)
+    except ValueError:
+        n = 0
+    return n or len(_paquets(*_cle(chemin)))
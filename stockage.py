@@ -0,0 +1,299 @@
+# stockage.py
+# Gestion de l’espace disque sous /tmp/appdata :
+# - inventaire des artefacts : chaque fichier ou dossier de premier niveau des zones fichiers,
+#   tmp (uploads), tmp/apercus et timelapse_jobs, avec sa taille et son dernier accès
+# - dernier accès tenu dans un index (acces.json) : atime n’est pas fiable (noatime / relatime)
+#   et mtime sert de clé aux caches (fiches média, aperçus, zip) ; un artefact inconnu de
+#   l’index y est noté à sa première vue
+# - nettoyage périodique dans un thread de fond, hors du chemin de rendu ; l’occupation affichée
+#   est l’inventaire du dernier nettoyage (jamais de parcours des zones au rendu)
+# - quota en octets et âge maximal (variables d’env QUOTA_STOCKAGE, AGE_MAX_STOCKAGE),
+#   éviction des artefacts les moins récemment utilisés
+# - jamais d’éviction des artefacts d’un job en cours (en_cours) ni d’un artefact modifié
+#   depuis moins de DELAI_GRACE (en cours d’écriture)
+
+import os
+import json
+import time
+import shutil
+import fnmatch
+import itertools
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+BASE_DIR = Path("/tmp/appdata")
+# Zones surveillées ; aperçus avant uploads (le dossier des aperçus est dans tmp)
+ZONES = {
+    "fichiers": BASE_DIR / "fichiers",
+    "aperçus": BASE_DIR / "tmp" / "apercus",
+    "uploads": BASE_DIR / "tmp",
+    "timelapse": BASE_DIR / "timelapse_jobs",
+}
+# État de l’application plutôt qu’artefacts : jamais évincés
+CONSERVES = {"cookies.txt"}
+INDEX_ACCES = BASE_DIR / "acces.json"
+
+QUOTA_DEFAUT = 5 * 1024 ** 3
+AGE_MAX_DEFAUT = 7 * 24 * 3600
+# Un artefact modifié depuis moins longtemps est peut-être en cours d’écriture
+DELAI_GRACE = 120
+# Intervalle minimal (s) entre deux nettoyages automatiques
+DELAI_NETTOYAGE = 300
+
+_verrou = threading.Lock()
+_proteges: Dict[int, List[str]] = {}   # jeton -> motifs protégés
+_jetons = itertools.count()
+_dernier_nettoyage: Optional[float] = None
+_dernier_inventaire: Optional[Tuple[Tuple["Artefact", ...], float]] = None   # (artefacts, date)
+
+def quota() -> int:
+    """
+    Budget disque (octets) des zones surveillées (variable d’env QUOTA_STOCKAGE).
+    """
+    try:
+        return max(0, int(os.environ.get("QUOTA_STOCKAGE", "")))
+    except ValueError:
+        return QUOTA_DEFAUT
+
+def age_max() -> float:
+    """
+    Âge maximal (s) d’un artefact sans accès (variable d’env AGE_MAX_STOCKAGE).
+    """
+    try:
+        return max(0.0, float(os.environ.get("AGE_MAX_STOCKAGE", "")))
+    except ValueError:
+        return AGE_MAX_DEFAUT
+
+# ---------------- Artefacts ----------------
+
+@dataclass(frozen=True)
+class Artefact:
+    chemin: Path
+    zone: str
+    octets: int
+    modifie: float   # dernière modification (fichier le plus récent pour un dossier)
+    acces: float     # dernier accès connu (index, ou première vue), au moins la dernière modification
+
+@dataclass(frozen=True)
+class Utilisation:
+    octets: int
+    nb: int
+    par_zone: Dict[str, int]
+    quota: int
+    age_max: float
+    plus_ancien: Optional[float]   # dernier accès de l’artefact le moins récemment utilisé
+    mesure: float                  # date de l’inventaire (fin du dernier nettoyage)
+
+def artefact_de(chemin) -> Optional[Path]:
+    """
+    Artefact (entrée de premier niveau d’une zone) contenant chemin, ou None hors des zones.
+    """
+    p = Path(os.path.abspath(chemin))
+    for racine in ZONES.values():
+        try:
+            rel = p.relative_to(racine)
+        except ValueError:
+            continue
+        if rel.parts and racine / rel.parts[0] not in ZONES.values():
+            return racine / rel.parts[0]
+    return None
+
+def _mesurer(p: Path) -> Tuple[int, float]:
+    st = p.stat()
+    if not p.is_dir():
+        return st.st_size, st.st_mtime
+    octets, modifie = 0, st.st_mtime
+    for dossier, _, noms in os.walk(p):
+        for nom in noms:
+            try:
+                s = os.stat(os.path.join(dossier, nom))
+            except OSError:
+                continue
+            octets += s.st_size
+            modifie = max(modifie, s.st_mtime)
+    return octets, modifie
+
+def _charger_acces() -> Dict[str, float]:
+    try:
+        return json.loads(INDEX_ACCES.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def _sauver_acces(d: Dict[str, float]) -> None:
+    tmp = INDEX_ACCES.with_name(INDEX_ACCES.name + ".tmp")
+    tmp.write_text(json.dumps(d), encoding="utf-8")
+    os.replace(tmp, INDEX_ACCES)
+
+def toucher(*chemins) -> None:
+    """
+    Note un accès maintenant aux artefacts contenant ces chemins (servis, réutilisés, affichés).
+    """
+    artefacts = {str(a) for a in map(artefact_de, chemins) if a is not None}
+    if not artefacts:
+        return
+    maintenant = time.time()
+    with _verrou:
+        d = _charger_acces()
+        d.update({a: maintenant for a in artefacts})
+        try:
+            _sauver_acces(d)
+        except OSError:
+            pass
+
+def _lister() -> List[Artefact]:
+    # Un artefact absent de l’index y entre à sa première vue : son mtime peut être ancien
+    # (yt-dlp reprend la date du serveur) sans qu’il ait jamais été utilisé
+    with _verrou:
+        acces = _charger_acces()
+    maintenant = time.time()
+    nouveaux = {}
+    res = []
+    for zone, racine in ZONES.items():
+        try:
+            entrees = list(racine.iterdir())
+        except OSError:
+            continue
+        for p in entrees:
+            if p.name in CONSERVES or p in ZONES.values():
+                continue
+            try:
+                octets, modifie = _mesurer(p)
+            except OSError:
+                continue
+            vu = acces.get(str(p))
+            if vu is None:
+                vu = nouveaux[str(p)] = maintenant
+            res.append(Artefact(p, zone, octets, modifie, max(modifie, vu)))
+    if nouveaux:
+        with _verrou:
+            d = _charger_acces()
+            for k, v in nouveaux.items():
+                d.setdefault(k, v)
+            try:
+                _sauver_acces(d)
+            except OSError:
+                pass
+    return res
+
+def utilisation() -> Optional[Utilisation]:
+    """
+    Occupation des zones d’après l’inventaire du dernier nettoyage (le parcours d’un dossier
+    d’images coûte un stat par fichier : jamais refait ici) ; None avant le premier nettoyage.
+    """
+    with _verrou:
+        inventaire = _dernier_inventaire
+    if inventaire is None:
+        return None
+    artefacts, mesure = inventaire
+    par_zone = {zone: 0 for zone in ZONES}
+    for a in artefacts:
+        par_zone[a.zone] += a.octets
+    return Utilisation(octets=sum(par_zone.values()), nb=len(artefacts), par_zone=par_zone,
+                       quota=quota(), age_max=age_max(),
+                       plus_ancien=min((a.acces for a in artefacts), default=None), mesure=mesure)
+
+# ---------------- Protection des jobs en cours ----------------
+
+class Protection:
+    """
+    Motifs protégés le temps d’un job (voir en_cours) ; ajouter() complète la liste en cours de route.
+    """
+    def __init__(self, jeton: int):
+        self._jeton = jeton
+
+    def ajouter(self, *motifs) -> None:
+        normalises = [_normaliser(m) for m in motifs if m]
+        with _verrou:
+            _proteges[self._jeton].extend(normalises)
+
+def _normaliser(motif) -> str:
+    # Un chemin sans joker protège l’artefact qui le contient ; un motif fnmatch est gardé tel quel
+    s = os.path.abspath(str(motif))
+    if any(c in s for c in "*?["):
+        return s
+    a = artefact_de(s)
+    return str(a) if a is not None else s
+
+@contextmanager
+def en_cours(*motifs) -> Iterator[Protection]:
+    """
+    Protège de l’éviction, le temps du bloc, les artefacts désignés par motifs : chemins (un
+    chemin à l’intérieur d’un artefact protège l’artefact entier) ou motifs fnmatch
+    (ex. fichiers/*<base>*).
+    """
+    protection = Protection(next(_jetons))
+    with _verrou:
+        _proteges[protection._jeton] = []
+    protection.ajouter(*motifs)
+    try:
+        yield protection
+    finally:
+        with _verrou:
+            del _proteges[protection._jeton]
+
+def _protege(a: Artefact, maintenant: float) -> bool:
+    if maintenant - a.modifie < DELAI_GRACE:
+        return True
+    with _verrou:
+        motifs = [m for liste in _proteges.values() for m in liste]
+    return any(fnmatch.fnmatchcase(str(a.chemin), m) for m in motifs)
+
+# ---------------- Éviction ----------------
+
+def _supprimer(p: Path) -> None:
+    if p.is_dir() and not p.is_symlink():
+        shutil.rmtree(p, ignore_errors=True)
+    else:
+        p.unlink(missing_ok=True)
+
+def nettoyer(quota_octets: Optional[int] = None, age_max_s: Optional[float] = None) -> Tuple[int, int]:
+    """
+    Évince les artefacts plus vieux que age_max_s, puis les moins récemment utilisés jusqu’à
+    repasser sous quota_octets (quota() et age_max() par défaut). Les artefacts protégés sont
+    sautés. Renvoie (nombre d’artefacts retirés, octets libérés).
+    """
+    global _dernier_nettoyage, _dernier_inventaire
+    quota_octets = quota() if quota_octets is None else quota_octets
+    age_max_s = age_max() if age_max_s is None else age_max_s
+    maintenant = time.time()
+    artefacts = sorted(_lister(), key=lambda a: a.acces)
+    total = sum(a.octets for a in artefacts)
+    retires = []
+    for a in artefacts:
+        if total <= quota_octets and maintenant - a.acces <= age_max_s:
+            break  # trié par dernier accès : les suivants sont plus récents
+        if _protege(a, maintenant):
+            continue
+        _supprimer(a.chemin)
+        total -= a.octets
+        retires.append(a)
+
+    retires_chemins = {a.chemin for a in retires}
+    restants = tuple(a for a in artefacts if a.chemin not in retires_chemins)
+    with _verrou:
+        _dernier_nettoyage = time.monotonic()
+        _dernier_inventaire = (restants, time.time())
+        d = _charger_acces()
+        presents = {str(a.chemin) for a in restants}
+        if set(d) - presents:
+            try:
+                _sauver_acces({k: v for k, v in d.items() if k in presents})
+            except OSError:
+                pass
+    return len(retires), sum(a.octets for a in retires)
+
+def nettoyer_periodiquement() -> bool:
+    """
+    Lance nettoyer() dans un thread de fond, au plus une fois par DELAI_NETTOYAGE dans ce
+    processus (le parcours des zones ne retarde pas l’affichage) ; False si ce n’est pas le moment.
+    """
+    global _dernier_nettoyage
+    with _verrou:
+        if _dernier_nettoyage is not None and time.monotonic() - _dernier_nettoyage < DELAI_NETTOYAGE:
+            return False
+        _dernier_nettoyage = time.monotonic()
+    threading.Thread(target=nettoyer, name="nettoyage-stockage", daemon=True).start()
+    return True
@@ -2,72 +2,38 @@
 # Timelapse SANS optical flow, API tolérante :
 # - debut/fin optionnels
 # - **kwargs accepté (ignore tout argument inconnu comme avec_flow)
-# - reprise d’extraction
-# - ré-encodage H.264 + faststart si ffmpeg dispo
+# - images échantillonnées envoyées directement à un seul encodeur ffmpeg libx264 (faststart) ;
+#   repli sur un MP4 mp4v écrit par OpenCV si libx264 manque ou si l’encodeur ffmpeg échoue
+# - images JPEG avec reprise d’extraction, sur demande ou pour terminer un job interrompu
+# - mode adaptatif : images presque statiques sautées (vignettes comparées avec NumPy)
+# - décodage et compression JPEG recouverts (threads d’écriture, file bornée)
+# - plage découpée en segments traités en parallèle (chacun sa capture), puis assemblés
+# - MP4 final mémorisé par job : une demande identique est servie sans relire ni réencoder
 # - cache sous /tmp/appdata
 
 import os
-import cv2
-import subprocess
-import shutil
-import stat
-import tarfile
-import time
 import json
+import queue
+import logging
+import itertools
+import threading
+import subprocess
+from functools import partial
 from pathlib import Path
-from typing import Optional, Tuple, List
+from typing import TYPE_CHECKING, Iterator, Optional, Tuple, List
+
+import encodage
+import medias
+# Résolution mémorisée (TTL, voir binaires.py) ; chemin_ffmpeg ré-exporté pour les appelants historiques
+from binaires import chemin_ffmpeg, encodeur_disponible
+
+if TYPE_CHECKING:  # annotations seulement : OpenCV reste chargé à la demande
+    import cv2
 
 BASE_DIR = Path("/tmp/appdata")
 TIMELAPSE_DIR = BASE_DIR / "timelapse_jobs"
-TIMELAPSE_DIR.mkdir(parents=True, exist_ok=True)
-
-# ---------------- Détection / fallback ffmpeg ----------------
-
-def _telecharger_ffmpeg_statique(dest_dir: Path) -> str:
-    import urllib.request
-    dest_dir.mkdir(parents=True, exist_ok=True)
-    url = "https://johnvansickle.com/ffmpeg/releases/ffmpeg-release-amd64-static.tar.xz"
-    archive = dest_dir / "ffmpeg-release-amd64-static.tar.xz"
-    urllib.request.urlretrieve(url, str(archive))
-    with tarfile.open(archive, "r:xz") as tf:
-        members = [m for m in tf.getmembers() if m.name.endswith("/ffmpeg")]
-        if not members:
-            raise RuntimeError("Archive ffmpeg invalide : binaire non trouvé.")
-        tf.extractall(path=dest_dir)
-    for p in dest_dir.glob("ffmpeg-*-amd64-static/ffmpeg"):
-        p.chmod(p.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
-        return str(p)
-    raise RuntimeError("Binaire ffmpeg introuvable après extraction.")
-
-def _resoudre_binaire(nom_env: str, nom: str) -> Optional[str]:
-    import shutil as _sh
-    cand = os.environ.get(nom_env)
-    if cand and Path(cand).exists():
-        return cand
-    which = _sh.which(nom)
-    if which:
-        return which
-    try:
-        import imageio_ffmpeg
-        p = imageio_ffmpeg.get_ffmpeg_exe()
-        if p and Path(p).exists():
-            return p
-    except Exception:
-        pass
-    cache_dir = BASE_DIR / "ffmpeg-bin"
-    for p in cache_dir.glob("ffmpeg-*-amd64-static/ffmpeg"):
-        if p.exists():
-            return str(p)
-    try:
-        return _telecharger_ffmpeg_statique(cache_dir)
-    except Exception:
-        return None
 
-def chemin_ffmpeg() -> str:
-    p = _resoudre_binaire("FFMPEG_BINARY", "ffmpeg")
-    if not p:
-        raise RuntimeError("ffmpeg introuvable et fallback impossible (réseau bloqué ?).")
-    return p
+logger = logging.getLogger(__name__)
 
 # ---------------- Utilitaires timelapse ----------------
 
@@ -87,12 +53,36 @@ def _sauver_progress(job_dir: Path, d: dict) -> None:
     p = _progress_path(job_dir)
     p.write_text(json.dumps(d, ensure_ascii=False, indent=2), encoding="utf-8")
 
-def _ouvrir_capture(chemin_video: str, debut: Optional[int], fin: Optional[int]) -> Tuple[cv2.VideoCapture, float, int, int]:
+def _infos_ou_rien(chemin_video: str) -> Optional[medias.InfosMedia]:
+    # Fiche ffprobe, ou None si ffprobe est introuvable (ex. imageio-ffmpeg seul) : OpenCV prend le relais
+    try:
+        return medias.infos(chemin_video)
+    except RuntimeError:
+        return None
+
+def _cadence_opencv(chemin_video: str) -> Tuple[float, int]:
+    # Cadence et nombre d’images annoncés par OpenCV (moins exacts en VFR que ffprobe)
+    import cv2
     cap = cv2.VideoCapture(chemin_video)
-    if not cap.isOpened():
-        raise RuntimeError("Impossible d’ouvrir la vidéo source (OpenCV).")
-    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
-    nb = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    try:
+        if not cap.isOpened():
+            raise RuntimeError("Impossible d’ouvrir la vidéo source (OpenCV).")
+        return float(cap.get(cv2.CAP_PROP_FPS) or 0), int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    finally:
+        cap.release()
+
+def _bornes_images(chemin_video: str, debut: Optional[int], fin: Optional[int]) -> Tuple[Optional[medias.InfosMedia], float, int, int]:
+    # Cadence et nombre d’images viennent de la fiche ffprobe (exacts, y compris en VFR / webm),
+    # sinon d’OpenCV
+    infos = _infos_ou_rien(chemin_video)
+    if infos is not None:
+        if infos.video is None:
+            raise RuntimeError("Aucun flux vidéo dans la source.")
+        fps = float(infos.fps) if infos.fps else 25.0
+        nb = medias.nb_images(chemin_video) or int(round((infos.duree or 0) * fps))
+    else:
+        fps, nb = _cadence_opencv(chemin_video)
+        fps = fps or 25.0
     if debut is None: debut = 0
     if fin is None or fin <= 0: fin = int(round(nb / fps)) if fps > 0 else 1
     if fin <= debut: fin = debut + 1
@@ -100,111 +90,590 @@ def _ouvrir_capture(chemin_video: str, debut: Optional[int], fin: Optional[int])
     frame_end = min(nb, int(round(fin * fps))) if fps > 0 else nb
     frame_start = max(0, frame_start)
     frame_end = max(frame_start + 1, frame_end)
-    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_start)
-    return cap, float(fps), frame_start, frame_end
+    return infos, float(fps), frame_start, frame_end
+
+# ---------------- Échantillonnage des images ----------------
+# Trois moteurs produisent les mêmes images (BGR, une sur ratio_saut à partir de frame_pos) :
+# - "grab"      : OpenCV, grab() sans conversion de couleur pour les images sautées
+# - "recherche" : OpenCV, saut direct à chaque image gardée (décodage depuis l’image clé précédente)
+# - "ffmpeg"    : filtre select de ffmpeg (décodage multi-thread, conversion des seules images
+#                 gardées) et images brutes lues sur un tube
+
+def choisir_moteur(ratio_saut: int, gop: Optional[float], ffmpeg_dispo: bool, coeurs: int) -> str:
+    """
+    Choisit le moteur d’échantillonnage le plus rapide pour ce ratio :
+    - saut par image clé quand l’écart entre deux images gardées dépasse deux GOP (chaque saut
+      décode au plus un GOP, au lieu de ratio_saut images en lecture continue) ;
+    - ffmpeg si des images sont jetées et que plusieurs cœurs peuvent décoder en parallèle
+      (sur un seul cœur, le passage par le tube coûte autant que grab) ;
+    - grab sinon.
+    """
+    if gop and ratio_saut >= 2 * gop:
+        return "recherche"
+    if ratio_saut >= 2 and ffmpeg_dispo and coeurs > 1:
+        return "ffmpeg"
+    return "grab"
+
+def _ouvrir_capture(chemin_video: str, frame_pos: int) -> "cv2.VideoCapture":
+    import cv2  # import différé : OpenCV n’est chargé que si un timelapse est lancé
+    cap = cv2.VideoCapture(chemin_video)
+    if not cap.isOpened():
+        raise RuntimeError("Impossible d’ouvrir la vidéo source (OpenCV).")
+    if frame_pos:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_pos)
+    return cap
+
+def _images_grab(chemin_video: str, frame_pos: int, frame_end: int, ratio_saut: int) -> Iterator:
+    cap = _ouvrir_capture(chemin_video, frame_pos)
+    try:
+        for pos in range(frame_pos, frame_end):
+            if (pos - frame_pos) % ratio_saut == 0:
+                ok, img = cap.read()
+                if not ok:
+                    return
+                yield img
+            elif not cap.grab():
+                return
+    finally:
+        cap.release()
+
+def _images_recherche(chemin_video: str, frame_pos: int, frame_end: int, ratio_saut: int) -> Iterator:
+    import cv2
+    cap = _ouvrir_capture(chemin_video, frame_pos)
+    try:
+        for pos in range(frame_pos, frame_end, ratio_saut):
+            if pos != frame_pos:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, pos)
+            ok, img = cap.read()
+            if not ok:
+                return
+            yield img
+    finally:
+        cap.release()
+
+def _images_ffmpeg(chemin_video: str, frame_pos: int, frame_end: int, ratio_saut: int,
+                   fps: float, largeur: int, hauteur: int) -> Iterator:
+    import numpy as np
+    nb = len(range(frame_pos, frame_end, ratio_saut))
+    args = [chemin_ffmpeg(), "-v", "error", "-nostdin", "-ss", f"{frame_pos / fps:.6f}", "-i", chemin_video,
+            "-an", "-sn", "-vf", f"select='not(mod(n,{ratio_saut}))'", "-fps_mode", "passthrough",
+            "-frames:v", str(nb), "-pix_fmt", "bgr24", "-f", "rawvideo", "pipe:1"]
+    taille = largeur * hauteur * 3
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=taille)
+    try:
+        while True:
+            brut = proc.stdout.read(taille)
+            if len(brut) < taille:
+                return
+            yield np.frombuffer(brut, dtype=np.uint8).reshape(hauteur, largeur, 3)
+    finally:
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+
+def echantillonner(chemin_video: str, frame_pos: int, frame_end: int, ratio_saut: int,
+                   moteur: Optional[str] = None) -> Iterator:
+    """
+    Produit les images BGR d’indices frame_pos, frame_pos + ratio_saut, ... (< frame_end).
+    moteur : "grab", "recherche" ou "ffmpeg" ; choisi automatiquement si None (choisir_moteur).
+    """
+    infos = _infos_ou_rien(chemin_video)
+    if infos is None:
+        # Sans fiche ffprobe : ni dimensions pour le tube ffmpeg, ni index des images clés
+        moteur = "recherche" if moteur == "recherche" else "grab"
+    elif moteur is None:
+        # Index des images clés lu seulement si un saut par image clé est envisageable
+        cles = len(medias.images_cles(chemin_video)) if ratio_saut >= 2 else 0
+        gop = medias.nb_images(chemin_video) / cles if cles else None
+        try:
+            ffmpeg_dispo = bool(chemin_ffmpeg())
+        except RuntimeError:
+            ffmpeg_dispo = False
+        moteur = choisir_moteur(ratio_saut, gop, ffmpeg_dispo, encodage.budget_coeurs())
+    if moteur == "recherche":
+        return _images_recherche(chemin_video, frame_pos, frame_end, ratio_saut)
+    if moteur == "ffmpeg":
+        fps = float(infos.fps) if infos.fps else 25.0
+        largeur, hauteur = int(infos.video["width"]), int(infos.video["height"])
+        # ffmpeg applique la rotation d’affichage (comme OpenCV) : images d’un portrait tourné
+        # de 90° en hauteur × largeur codées
+        if medias.rotation(infos.video) % 180 == 90:
+            largeur, hauteur = hauteur, largeur
+        return _images_ffmpeg(chemin_video, frame_pos, frame_end, ratio_saut, fps, largeur, hauteur)
+    return _images_grab(chemin_video, frame_pos, frame_end, ratio_saut)
+
+# ---------------- Segments parallèles ----------------
+# La plage d’images gardées [0, nb) est découpée en segments contigus ; chaque segment a sa
+# propre capture (ou son propre ffmpeg) et produit les images à leurs indices globaux.
+
+# En dessous, l’ouverture d’une capture et la recherche initiale coûtent plus que le segment
+IMAGES_MIN_SEGMENT = 120
+
+def decouper_segments(nb_images: int, nb_segments: int) -> List[Tuple[int, int]]:
+    """
+    Découpe les indices d’images gardées [0, nb_images) en au plus nb_segments plages
+    contiguës [début, fin) de tailles égales à une image près.
+    """
+    nb_segments = max(1, min(nb_segments, nb_images))
+    bornes = [nb_images * k // nb_segments for k in range(nb_segments + 1)]
+    return [(bornes[k], bornes[k + 1]) for k in range(nb_segments) if bornes[k] < bornes[k + 1]]
+
+def nb_segments_auto(nb_images: int) -> int:
+    """
+    Un segment par cœur du budget, chacun d’au moins IMAGES_MIN_SEGMENT images gardées.
+    """
+    return max(1, min(encodage.budget_coeurs(), nb_images // IMAGES_MIN_SEGMENT))
+
+def _images_segment(src_path: str, frame_start: int, frame_end: int, ratio_saut: int,
+                    premier: int, fin: int, moteur: Optional[str] = None) -> Iterator:
+    # Images gardées d’indices globaux premier .. fin - 1
+    return echantillonner(src_path, frame_start + premier * ratio_saut,
+                          min(frame_start + fin * ratio_saut, frame_end), ratio_saut, moteur)
+
+# ---------------- Timelapse adaptatif ----------------
+# Chaque candidate (une image sur ratio_saut) est comparée à la dernière image gardée sur une
+# vignette en niveaux de gris : les images quasi identiques sont sautées (scènes statiques),
+# sans jamais sauter plus de ecart_max - 1 candidates d’affilée.
+
+# Largeur approximative des vignettes comparées ; seuil = écart absolu moyen (niveaux 0-255)
+LARGEUR_VIGNETTE = 64
+SEUIL_MOUVEMENT_DEFAUT = 2.0
+ECART_MAX_DEFAUT = 10
+
+def vignette(img):
+    """
+    Vignette en niveaux de gris (float32) d’une image BGR, sous-échantillonnée par pas entier.
+    """
+    import numpy as np
+    pas = max(1, img.shape[1] // LARGEUR_VIGNETTE)
+    return img[::pas, ::pas] @ np.array([0.114, 0.587, 0.299], dtype=np.float32)
+
+class FiltreMouvement:
+    """
+    Décide pour chaque candidate si elle diffère assez de la dernière image gardée ; la première
+    candidate est toujours gardée. ecart_max : écart maximal, en candidates, entre deux images
+    gardées (1 = tout garder).
+    """
+    def __init__(self, seuil: float = SEUIL_MOUVEMENT_DEFAUT, ecart_max: int = ECART_MAX_DEFAUT):
+        self.seuil = seuil
+        self.ecart_max = max(1, ecart_max)
+        self._reference = None
+        self._sautees = 0
+
+    def garder(self, img) -> bool:
+        import numpy as np
+        v = vignette(img)
+        if (self._reference is not None and self._sautees + 1 < self.ecart_max
+                and float(np.abs(v - self._reference).mean()) < self.seuil):
+            self._sautees += 1
+            return False
+        self._reference = v
+        self._sautees = 0
+        return True
+
+def _images_filtrees(images: Iterator, filtre: Optional[FiltreMouvement]) -> Iterator:
+    # Le générateur source reste à fermer par l’appelant
+    return images if filtre is None else (img for img in images if filtre.garder(img))
+
+# ---------------- Écriture des JPEG ----------------
+
+QUALITE_JPEG = 95
+# Images décodées en attente d’écriture : borne fixe (une image 4K pèse ~25 Mo), indépendante du nombre de cœurs
+TAILLE_FILE_ECRIVAINS = 8
+
+class _Ecrivains:
+    """
+    Threads d’écriture JPEG alimentés par une file bornée : le décodage continue pendant la
+    compression (cv2.imencode libère le GIL) et au plus taille_file images attendent en mémoire.
+    Chaque fichier est écrit sous un nom temporaire puis renommé (jamais de JPEG tronqué).
+    """
+    def __init__(self, nb: int, taille_file: int = TAILLE_FILE_ECRIVAINS):
+        self._file: queue.Queue = queue.Queue(maxsize=max(1, taille_file))
+        self._erreur: Optional[BaseException] = None
+        self._threads = [threading.Thread(target=self._boucle, daemon=True) for _ in range(max(1, nb))]
+        for t in self._threads:
+            t.start()
+
+    def _boucle(self) -> None:
+        import cv2
+        while True:
+            tache = self._file.get()
+            if tache is None:
+                return
+            if self._erreur is not None:
+                continue  # après une erreur, la file est vidée sans écrire (le producteur ne bloque pas)
+            chemin, img, apres = tache
+            try:
+                ok, jpeg = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), QUALITE_JPEG])
+                if not ok:
+                    raise RuntimeError(f"Encodage JPEG impossible : {chemin.name}")
+                part = chemin.with_name(chemin.name + ".part")
+                part.write_bytes(jpeg)
+                os.replace(part, chemin)
+                if apres:
+                    apres()
+            except Exception as e:
+                self._erreur = e
+
+    def soumettre(self, chemin: Path, img, apres=None) -> None:
+        """
+        Met une image en file (bloque si la file est pleine) ; apres() est appelé une fois écrite.
+        """
+        if self._erreur is not None:
+            raise self._erreur
+        self._file.put((chemin, img, apres))
+
+    def fermer(self) -> None:
+        """
+        Attend l’écriture des images en file et arrête les threads ; lève la première erreur.
+        """
+        for _ in self._threads:
+            self._file.put(None)
+        for t in self._threads:
+            t.join()
+        if self._erreur is not None:
+            raise self._erreur
+
+# ---------------- Extraction avec reprise ----------------
 
 def _extraire_images_avec_reprise(src_path: str, job_dir: Path, fps_cible: int,
                                   debut: Optional[int], fin: Optional[int],
-                                  batch_frames: int = 1200) -> Tuple[int, int]:
+                                  batch_frames: int = 1200, moteur: Optional[str] = None,
+                                  segments: Optional[int] = 1, rappel=None,
+                                  ecrivains: Optional[int] = None, seuil_mouvement: Optional[float] = None,
+                                  ecart_max: int = ECART_MAX_DEFAUT) -> Tuple[int, int]:
+    # Chaque segment reprend après la dernière candidate traitée sans trou à partir de son début ;
+    # progress.json garde l’avancement de chaque segment. Les segments décodent et confient
+    # chaque image à `ecrivains` threads d’écriture (budget de cœurs par défaut).
+    # seuil_mouvement : mode adaptatif (FiltreMouvement) ; les candidates sautées n’ont pas de JPEG,
+    # la reprise s’appuie alors sur progress.json plutôt que sur les fichiers présents.
     images_dir = job_dir / "images"
     images_dir.mkdir(exist_ok=True)
 
-    cap, fps, frame_start, frame_end = _ouvrir_capture(src_path, debut, fin)
+    _, fps, frame_start, frame_end = _bornes_images(src_path, debut, fin)
     ratio_saut = max(1, int(round(fps / float(fps_cible))))
+    nb_total = len(range(frame_start, frame_end, ratio_saut))
+    plages = decouper_segments(nb_total, segments or nb_segments_auto(nb_total))
 
-    existantes = sorted(images_dir.glob("frame_*.jpg"))
-    next_index = 0
-    if existantes:
+    existantes = set()
+    for f in images_dir.glob("frame_*.jpg"):
         try:
-            next_index = int(existantes[-1].stem.split("_")[1]) + 1
-        except Exception:
-            next_index = len(existantes)
+            existantes.add(int(f.stem.split("_")[1]))
+        except (IndexError, ValueError):
+            pass
+    # Un lot couvre batch_frames images source, soit batch_frames / ratio_saut images gardées
+    par_lot = max(1, batch_frames // ratio_saut)
 
-    frame_pos = frame_start + next_index * ratio_saut
-    if frame_pos < frame_end:
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_pos)
+    progress = {
+        "fps_source": fps,
+        "frame_start": frame_start,
+        "frame_end": frame_end,
+        "ratio_saut": ratio_saut,
+        "seuil_mouvement": seuil_mouvement,
+        "ecart_max": ecart_max if seuil_mouvement is not None else None,
+        "segments": [{"premier": a, "fin": b, "candidats_traites": 0, "images_sauvegardees": 0} for a, b in plages],
+        "images_sauvegardees": 0
+    }
+    precedent = _charger_progress(job_dir)
+    meme_plan = all(precedent.get(c) == progress[c] for c in
+                    ("frame_start", "frame_end", "ratio_saut", "seuil_mouvement", "ecart_max")) and \
+        [(s.get("premier"), s.get("fin")) for s in precedent.get("segments", [])] == plages
+    verrou = threading.Lock()
+    # Fin de la suite de candidates traitées sans trou depuis le début de chaque segment,
+    # et nombre d’images gardées (écrites) dans cette suite
+    contigus, gardees = [], []
+    for k, (premier, fin_seg) in enumerate(plages):
+        n = premier
+        while n < fin_seg and n in existantes:
+            n += 1
+        if meme_plan:
+            n = max(n, premier + int(precedent["segments"][k].get("candidats_traites", 0)))
+        contigus.append(min(n, fin_seg))
+        gardees.append(sum(1 for i in existantes if premier <= i < contigus[k]))
 
-    total = next_index
-    while frame_pos < frame_end:
-        courant = 0
-        lot: List = []
-        while courant < batch_frames and frame_pos < frame_end:
-            ok, img = cap.read()
-            if not ok:
-                break
-            if ((frame_pos - frame_start) % ratio_saut) == 0:
-                lot.append(img)
-            courant += 1
-            frame_pos += 1
-
-        if not lot:
-            continue
-
-        for img in lot:
-            cv2.imwrite(str(images_dir / f"frame_{total:06d}.jpg"), img, [int(cv2.IMWRITE_JPEG_QUALITY), 95])
-            total += 1
-
-        _sauver_progress(job_dir, {
-            "fps_source": fps,
-            "frame_start": frame_start,
-            "frame_end": frame_end,
-            "ratio_saut": ratio_saut,
-            "images_sauvegardees": total
-        })
-        time.sleep(0.01)
-
-    cap.release()
-    return int(round(fps)), total
-
-def _construire_video_depuis_images(job_dir: Path, fps_sortie: int, base_nom: str) -> str:
+    def _noter(k: int) -> None:
+        with verrou:
+            segment = progress["segments"][k]
+            segment["candidats_traites"] = contigus[k] - segment["premier"]
+            segment["images_sauvegardees"] = gardees[k]
+            progress["images_sauvegardees"] = sum(s["images_sauvegardees"] for s in progress["segments"])
+            _sauver_progress(job_dir, progress)
+
+    pool = _Ecrivains(ecrivains or encodage.budget_coeurs())
+
+    def _segment(k: int, noter) -> None:
+        premier, fin_seg = plages[k]
+        etape = f"timelapse : images, segment {k + 1}/{len(plages)}"
+        duree = (fin_seg - premier) * ratio_saut / fps
+        ecrites = set()
+        verrou_segment = threading.Lock()
+
+        def _traitee(idx: int, gardee: bool) -> None:
+            # Appelé par un thread d’écriture (ou par le segment pour une candidate sautée) : les
+            # images finissent dans le désordre, le point de reprise n’avance que sur la suite
+            # contiguë, tous les par_lot candidates
+            with verrou_segment:
+                ecrites.add(idx)
+                if gardee:
+                    gardees[k] += 1
+                avant = contigus[k]
+                while contigus[k] in ecrites:
+                    ecrites.discard(contigus[k])
+                    contigus[k] += 1
+                if (contigus[k] - premier) // par_lot != (avant - premier) // par_lot:
+                    _noter(k)
+                    noter(encodage.Progression(etape, (contigus[k] - premier) * ratio_saut / fps, duree))
+
+        if contigus[k] >= fin_seg:
+            return
+        filtre = FiltreMouvement(seuil_mouvement, ecart_max) if seuil_mouvement is not None else None
+        if filtre is not None:
+            # Images d’un essai précédent au-delà du point de reprise : les décisions peuvent changer
+            for i in existantes:
+                if contigus[k] <= i < fin_seg:
+                    (images_dir / f"frame_{i:06d}.jpg").unlink(missing_ok=True)
+        images = _images_segment(src_path, frame_start, frame_end, ratio_saut, contigus[k], fin_seg, moteur)
+        try:
+            for idx, img in enumerate(images, start=contigus[k]):
+                if filtre is not None and not filtre.garder(img):
+                    _traitee(idx, False)
+                    continue
+                pool.soumettre(images_dir / f"frame_{idx:06d}.jpg", img, partial(_traitee, idx, True))
+        finally:
+            images.close()
+
+    try:
+        encodage.executer_taches([partial(_segment, k) for k in range(len(plages))],
+                                 [f"timelapse : images, segment {k + 1}/{len(plages)}" for k in range(len(plages))],
+                                 rappel=rappel)
+    finally:
+        pool.fermer()
+    for k in range(len(plages)):
+        _noter(k)
+    return int(round(fps)), progress["images_sauvegardees"]
+
+# ---------------- Encodage ----------------
+
+ARGS_X264_TIMELAPSE = ["-c:v", "libx264", "-preset", "fast", "-crf", "23", "-pix_fmt", "yuv420p",
+                       "-movflags", "+faststart"]
+# x264 en 4:2:0 exige des dimensions paires
+FILTRE_PAIR = "crop=trunc(iw/2)*2:trunc(ih/2)*2"
+
+def _encoder_flux(images: Iterator, out: Path, fps_sortie: int, nb_attendu: int, rappel=None,
+                  threads: Optional[int] = None, etape: str = "timelapse : encodage H.264") -> int:
+    # Envoie les images BGR brutes sur l’entrée d’un seul ffmpeg libx264 (pas de fichier
+    # intermédiaire). Renvoie le nombre d’images encodées.
+    premiere = next(images, None)
+    if premiere is None:
+        raise RuntimeError("Aucune image à encoder pour le timelapse.")
+    h, w = premiere.shape[:2]
+    nb = 0
+
+    def _blocs():
+        nonlocal nb
+        for img in itertools.chain([premiere], images):
+            nb += 1
+            yield img.data
+
+    encodage.executer_ffmpeg(
+        [chemin_ffmpeg(), "-y", "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{w}x{h}", "-framerate", str(fps_sortie),
+         "-i", "pipe:0", "-vf", FILTRE_PAIR] + ARGS_X264_TIMELAPSE +
+        (["-threads", str(threads)] if threads else []) + [str(out)],
+        etape, nb_attendu / float(fps_sortie) if nb_attendu else None, rappel, entree=_blocs()
+    )
+    return nb
+
+def _encoder_mp4v(images: Iterator, out: Path, fps_sortie: int) -> int:
+    # Repli sans libx264 : MP4 mp4v écrit par OpenCV. Renvoie le nombre d’images écrites.
+    import cv2
+    premiere = next(images, None)
+    if premiere is None:
+        raise RuntimeError("Aucune image à encoder pour le timelapse.")
+    h, w = premiere.shape[:2]
+    vw = cv2.VideoWriter(str(out), cv2.VideoWriter_fourcc(*"mp4v"), fps_sortie, (w, h))
+    if not vw.isOpened():
+        raise RuntimeError("Encodeur mp4v d’OpenCV indisponible.")
+    nb = 0
+    try:
+        for img in itertools.chain([premiere], images):
+            vw.write(img if img.shape[:2] == (h, w) else cv2.resize(img, (w, h)))
+            nb += 1
+    finally:
+        vw.release()
+    return nb
+
+def _lire_jpeg(fichiers: List[Path]) -> Iterator:
+    import cv2
+    for f in fichiers:
+        img = cv2.imread(str(f))
+        if img is not None:
+            yield img
+
+def _construire_video_depuis_images(job_dir: Path, fps_sortie: int, base_nom: str, rappel=None) -> str:
+    # Encode les JPEG du job en un seul passage ffmpeg (démultiplexeur image2, motif glob :
+    # un segment arrêté quelques images avant sa fin ne coupe pas la suite) ; mp4v via OpenCV
+    # si libx264 manque ou si ffmpeg échoue
     images_dir = job_dir / "images"
     fichiers = sorted(images_dir.glob("frame_*.jpg"))
     if not fichiers:
         raise RuntimeError("Aucune image prête pour le timelapse.")
-    img0 = cv2.imread(str(fichiers[0]))
-    if img0 is None:
-        raise RuntimeError("Impossible de lire la première image.")
-    h, w = img0.shape[:2]
-
-    out_brut = job_dir / f"{base_nom}_timelapse_{fps_sortie}fps_brut.mp4"
-    vw = cv2.VideoWriter(str(out_brut), cv2.VideoWriter_fourcc(*"mp4v"), fps_sortie, (w, h))
-    for fp in fichiers:
-        im = cv2.imread(str(fp))
-        if im is None:
-            continue
-        if im.shape[:2] != (h, w):
-            im = cv2.resize(im, (w, h))
-        vw.write(im)
-    vw.release()
-
     out_final = job_dir / f"{base_nom}_timelapse_{fps_sortie}fps.mp4"
-    try:
-        ffmpeg = chemin_ffmpeg()
-    except Exception:
-        ffmpeg = None
-
-    if ffmpeg:
+    if encodeur_disponible("libx264"):
         try:
-            subprocess.run(
-                [ffmpeg, "-y", "-i", str(out_brut), "-vcodec", "libx264", "-preset", "fast", "-crf", "23",
-                 "-movflags", "+faststart", str(out_final)],
-                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
+            encodage.executer_ffmpeg(
+                [chemin_ffmpeg(), "-y", "-framerate", str(fps_sortie), "-pattern_type", "glob",
+                 "-i", str(images_dir / "frame_*.jpg"), "-vf", FILTRE_PAIR] + ARGS_X264_TIMELAPSE + [str(out_final)],
+                "timelapse : encodage H.264", len(fichiers) / float(fps_sortie), rappel
             )
             return str(out_final)
-        except Exception:
-            return str(out_brut)
-    else:
-        return str(out_brut)
+        except encodage.ErreurFFmpeg as e:
+            logger.warning("Encodage H.264 du timelapse impossible, repli mp4v : %s", e)
+    _encoder_mp4v(_lire_jpeg(fichiers), out_final, fps_sortie)
+    return str(out_final)
+
+def _joindre(morceaux: List[Path], out: Path, dossier: Path) -> None:
+    # Concatène sans réencodage des segments encodés avec les mêmes paramètres
+    liste = dossier / "segments.txt"
+    liste.write_text("".join(f"file '{m.resolve()}'\n" for m in morceaux), encoding="utf-8")
+    r = subprocess.run([chemin_ffmpeg(), "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", str(liste),
+                        "-c", "copy", "-movflags", "+faststart", str(out)],
+                       capture_output=True, text=True, check=False)
+    if r.returncode != 0:
+        raise RuntimeError(f"Assemblage des segments du timelapse impossible : {r.stderr.strip()[-500:]}")
+
+def _timelapse_en_flux(src_path: str, job_dir: Path, fps: int, base_nom: str,
+                       debut: Optional[int], fin: Optional[int], rappel=None,
+                       segments: Optional[int] = 1, seuil_mouvement: Optional[float] = None,
+                       ecart_max: int = ECART_MAX_DEFAUT) -> Tuple[str, int]:
+    # Échantillonnage et encodage en un seul passage, sans JPEG ni reprise ; avec plusieurs
+    # segments, chacun encode son morceau (cœurs du budget partagés) puis les morceaux sont joints.
+    # Sans libx264, ou si l’encodeur ffmpeg échoue, un seul segment est écrit en mp4v par OpenCV.
+    _, fps_source, frame_start, frame_end = _bornes_images(src_path, debut, fin)
+    ratio_saut = max(1, int(round(fps_source / float(fps))))
+    nb_total = len(range(frame_start, frame_end, ratio_saut))
+    x264 = encodeur_disponible("libx264")
+    plages = decouper_segments(nb_total, (segments or nb_segments_auto(nb_total)) if x264 else 1)
+    out_final = job_dir / f"{base_nom}_timelapse_{fps}fps.mp4"
+    threads = max(1, encodage.budget_coeurs() // len(plages)) if len(plages) > 1 else None
+    etapes = [f"timelapse : segment {k + 1}/{len(plages)}" for k in range(len(plages))]
+    morceaux = [out_final] if len(plages) == 1 else \
+        [job_dir / f"segment_{k:03d}.mp4" for k in range(len(plages))]
+
+    def _segment(k: int, noter) -> int:
+        premier, fin_seg = plages[k]
+        images = _images_segment(src_path, frame_start, frame_end, ratio_saut, premier, fin_seg)
+        filtre = FiltreMouvement(seuil_mouvement, ecart_max) if seuil_mouvement is not None else None
+        try:
+            if not x264:
+                return _encoder_mp4v(_images_filtrees(images, filtre), morceaux[k], fps)
+            # En mode adaptatif, le nombre d’images encodées n’est connu qu’à la fin
+            return _encoder_flux(_images_filtrees(images, filtre), morceaux[k], fps,
+                                 fin_seg - premier if filtre is None else None, noter, threads,
+                                 etapes[k] if len(plages) > 1 else "timelapse : encodage H.264")
+        finally:
+            images.close()
+
+    try:
+        if len(plages) == 1:
+            comptes = [_segment(0, rappel)]
+        else:
+            try:
+                comptes = encodage.executer_taches([partial(_segment, k) for k in range(len(plages))], etapes,
+                                                   rappel=rappel)
+                _joindre(morceaux, out_final, job_dir)
+            finally:
+                for m in morceaux + [job_dir / "segments.txt"]:
+                    m.unlink(missing_ok=True)
+    except encodage.ErreurFFmpeg as e:
+        if not x264:
+            raise
+        logger.warning("Encodage H.264 du timelapse impossible, repli mp4v : %s", e)
+        x264, plages, morceaux = False, decouper_segments(nb_total, 1), [out_final]
+        comptes = [_segment(0, rappel)]
+    _sauver_progress(job_dir, {
+        "mode": "flux",
+        "fps_source": fps_source,
+        "frame_start": frame_start,
+        "frame_end": frame_end,
+        "ratio_saut": ratio_saut,
+        "seuil_mouvement": seuil_mouvement,
+        "segments": [{"premier": a, "fin": b, "images_encodees": n} for (a, b), n in zip(plages, comptes)],
+        "images_encodees": sum(comptes)
+    })
+    return str(out_final), sum(comptes)
+
+# ---------------- Résultat mémorisé ----------------
+# Le job est identifié par le contenu de la source, la cadence et la plage (voir hash_job dans
+# main.py) : un MP4 final déjà produit pour ce job est renvoyé tel quel.
+
+def _resultat_path(job_dir: Path) -> Path:
+    return job_dir / "resultat.json"
+
+def _resultat_memorise(job_dir: Path, avec_images: bool, parametres: dict) -> Optional[Tuple[str, int]]:
+    # (chemin, nb_images) si le MP4 final est intact, produit avec les mêmes paramètres et
+    # accompagné des JPEG s’ils sont demandés
+    try:
+        d = json.loads(_resultat_path(job_dir).read_text(encoding="utf-8"))
+        out = job_dir / d["fichier"]
+        if out.stat().st_size != d["taille"] or (avec_images and not d.get("images")) \
+                or d.get("parametres", {}) != parametres:
+            return None
+        return str(out), int(d["nb_images"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def _memoriser_resultat(job_dir: Path, out: str, nb: int, images: bool, parametres: dict) -> None:
+    p = _resultat_path(job_dir)
+    tmp = p.with_name(p.name + ".tmp")
+    tmp.write_text(json.dumps({"fichier": Path(out).name, "taille": Path(out).stat().st_size,
+                               "nb_images": nb, "images": images, "parametres": parametres}), encoding="utf-8")
+    os.replace(tmp, p)
+
+def dossier_images(job_id: str) -> Path:
+    """
+    Dossier des images JPEG d’un job (rempli seulement si elles sont conservées).
+    """
+    return TIMELAPSE_DIR / f"job_{job_id}" / "images"
 
 def executer_timelapse(src_path: str, job_id: str, base_nom: str, fps: int,
                        debut: Optional[int] = None, fin: Optional[int] = None,
-                       **kwargs) -> Tuple[str, int]:
+                       rappel=None, conserver_images: bool = False, segments: Optional[int] = 1,
+                       ecrivains: Optional[int] = None, seuil_mouvement: Optional[float] = None,
+                       ecart_max: int = ECART_MAX_DEFAUT, **kwargs) -> Tuple[str, int]:
     """
-    Exécute le pipeline timelapse avec reprise. Renvoie (chemin_fichier_final, nb_images).
-    debut/fin optionnels. **kwargs ignoré (compatibilité : accepte avec_flow sans l’utiliser).
+    Exécute le pipeline timelapse. Renvoie (chemin_fichier_final, nb_images).
+    Par défaut les images échantillonnées passent directement dans l’encodeur (aucun JPEG).
+    conserver_images=True écrit les JPEG (dossier_images) avec reprise ; ce mode est aussi
+    repris automatiquement si un job interrompu a déjà laissé des images.
+    segments : nombre de segments traités en parallèle (1 = séquentiel, None = selon le budget
+    de cœurs et la longueur de la plage, voir nb_segments_auto). ecrivains : threads d’écriture
+    des JPEG (budget de cœurs par défaut).
+    seuil_mouvement : mode adaptatif, les images presque identiques à la dernière gardée sont
+    sautées (voir FiltreMouvement), au plus ecart_max - 1 d’affilée ; None = cadence fixe.
+    Le job_id doit distinguer ces paramètres (les images d’un job sont reprises telles quelles).
+    Un job déjà terminé (même job_id) renvoie aussitôt son MP4 final, sans relire les images.
+    debut/fin optionnels. rappel optionnel : reçoit la progression (une liste avec plusieurs segments).
+    **kwargs ignoré (compatibilité : accepte avec_flow sans l’utiliser).
     """
     job_dir = TIMELAPSE_DIR / f"job_{job_id}"
-    (job_dir / "images").mkdir(parents=True, exist_ok=True)
-    _, nb = _extraire_images_avec_reprise(src_path, job_dir, fps, debut, fin)
-    out = _construire_video_depuis_images(job_dir, fps, base_nom)
+    job_dir.mkdir(parents=True, exist_ok=True)
+    parametres = {"seuil_mouvement": seuil_mouvement,
+                  "ecart_max": ecart_max if seuil_mouvement is not None else None}
+    deja = _resultat_memorise(job_dir, conserver_images, parametres)
+    if deja is not None:
+        return deja
+    _resultat_path(job_dir).unlink(missing_ok=True)
+    images_dir = job_dir / "images"
+    reprise = images_dir.is_dir() and next(images_dir.glob("frame_*.jpg"), None) is not None
+    if not (conserver_images or reprise):
+        out, nb = _timelapse_en_flux(src_path, job_dir, fps, base_nom, debut, fin, rappel, segments,
+                                     seuil_mouvement, ecart_max)
+        _memoriser_resultat(job_dir, out, nb, False, parametres)
+        return out, nb
+    images_dir.mkdir(exist_ok=True)
+    _, nb = _extraire_images_avec_reprise(src_path, job_dir, fps, debut, fin, segments=segments, rappel=rappel,
+                                          ecrivains=ecrivains, seuil_mouvement=seuil_mouvement, ecart_max=ecart_max)
+    out = _construire_video_depuis_images(job_dir, fps, base_nom, rappel)
+    _memoriser_resultat(job_dir, out, nb, True, parametres)
     return out, nb